@@ -0,0 +1,78 @@
+"""
+    Structured event log for a Game.
+
+    Every event is one JSON object per line (JSONL) with the fields
+    turn, player (None for game events), kind and the fields listed for
+    its kind below. Lines are buffered and written in blocks.
+
+    Only events at or below the log level are kept, so a log at
+    LEVEL_GAME costs almost nothing per turn.
+"""
+import json
+import sys
+
+    # Levels
+LEVEL_OFF    = 0
+LEVEL_GAME   = 1   # end of game
+LEVEL_TURN   = 2   # circle status changes and charges
+LEVEL_ACTION = 3   # every player command
+
+    # Kinds of event, and their fields
+MOVE     = "move"       # src, dst, gold
+NO_MOVE  = "no_move"    # src, dst, gold          (dst is not a neighbour of src)
+BUY      = "buy"        # node, product, amount, cost, gold
+SELL     = "sell"       # node, product, amount, cost, gold
+RESEARCH = "research"   # node, gold
+PASS     = "pass"       # node, gold
+REFUSED  = "refused"    # node, reason, gold      (a BUY or SELL that was not allowed)
+INTEREST = "interest"   # amount                  (interest charged on negative gold)
+PENALTY  = "penalty"    # node, amount            (charge for being on a black node)
+STATUS   = "status"     # node, status            (Map.NODE_STATUS_* the node changed to)
+END      = "end"        # scores
+
+
+class EventLog:
+    def __init__(self, sink=None, level=LEVEL_ACTION, buffer_size=4096):
+        """ @param sink File object, or file name to write to. Defaults to sys.stdout.
+            @param level Keep events with a level <= this.
+            @param buffer_size Number of events held before they are written.
+        """
+        self.owns_sink = isinstance(sink, str)
+        if self.owns_sink:
+            sink = open(sink, "w", buffering=1 << 20)
+        self.sink = sys.stdout if sink is None else sink
+        self.level = level
+        self.buffer_size = buffer_size
+        self.buffer = []
+
+    def emit(self, level, turn, player, kind, **fields):
+        """Record one event if level is enabled.
+        """
+        if level > self.level:
+            return
+        fields["turn"] = turn
+        fields["player"] = player
+        fields["kind"] = kind
+        self.buffer.append(json.dumps(fields))
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            lines = self.buffer
+            self.buffer = []
+            self.sink.write("\n".join(lines) + "\n")
+        self.sink.flush()
+
+    def close(self):
+        self.flush()
+        if self.owns_sink:
+            self.sink.close()
+
+
+def read_events(file_name):
+    """@return Generator of the events (dictionaries) in a JSONL log file.
+    """
+    with open(file_name) as f:
+        for line in f:
+            yield json.loads(line)
@@ -3,15 +3,21 @@ Player IDs are ints 1...N
 Map locations are str names.
 """
 import random
-import time
+from collections import deque
 import Command
+import EventLog
 from BasePlayer import BasePlayer
 from Market import *
-from Map import Map
+from Map import Map, FrozenMap, HOP_TABLE_MAX_NODES
+from PlayerTable import PlayerTable
 import copy
-import string
+import numpy as np
 import traceback
-from Timer import Timer, silence_stdout
+import sys
+import pickle
+import struct
+from types import MappingProxyType
+from Timer import PlayerWorker, silence_stdout
 
 NUM_TURNS = 300
 
@@ -23,51 +29,130 @@ OUTSIDE_CIRCLE_PENALTY = 100  # gold per turn outside circle
 
 EXCHANGE_LENGTH = 4   # number of markets to exchange information upon from each co-located player
 
+HISTORY_LENGTH = NUM_TURNS   # most recent researches kept per player for the rumour exchange
+
     # Indexes into player tuple
 INFO_LOC = 0   # location str
 INFO_N   = 1   # number of turns at this location (int)
 INFO_OBJ = 2   # Player object (as supplied by student)
 INFO_INV = 3   # player inventory (dictionary keyed by product and INV_GOLD)
-INFO_HISTORY = 4   # player visit list (list of node names researched in order)
+INFO_HISTORY = 4   # player visit list (deque of the last HISTORY_LENGTH node names researched, in order)
 INFO_GOAL = 5   # goal set for player at start of game
 
     # indexes into Inventory
 INV_GOLD = 'Gold'
 
 MSG_NO_RESEARCH = "You have not researched this market"
+MSG_NO_GOLD = "Not enough gold to buy anything."
+
+SNAPSHOT_MAGIC = b"MRSNAP"
+SNAPSHOT_VERSION = 2
+SNAPSHOT_HEADER = struct.Struct("<6sH")   # magic, version
+
+def read_only(d):
+    """@return A read-only view of dictionary d."""
+    return MappingProxyType(d)
+
+class PlayerRow(dict):
+    """Entry of Game.players for a vectorised game.
+       INFO_LOC, INFO_N and INFO_INV are read from and written to the PlayerTable,
+       the remaining INFO_* fields are stored in the dict itself.
+    """
+    def __init__(self, table, row, fields):
+        super().__init__(fields)
+        self.table = table
+        self.row = row
+        self.inv = table.inventory(row)
+
+    def __getitem__(self, key):
+        if key == INFO_LOC:
+            return self.table.node_names[self.table.loc[self.row]]
+        if key == INFO_N:
+            return int(self.table.n[self.row])
+        if key == INFO_INV:
+            return self.inv
+        return dict.__getitem__(self, key)
+
+    def __setitem__(self, key, value):
+        if key == INFO_LOC:
+            self.table.loc[self.row] = self.table.node_ids[value]
+        elif key == INFO_N:
+            self.table.n[self.row] = value
+        else:
+            dict.__setitem__(self, key, value)
 
 class Game:
-    def __init__(self, player_list, verbose=False, interest_rate=0.10):
+    def __init__(self, player_list, verbose=False, interest_rate=0.10, use_workers=True, vectorised=False,
+                 read_only_inputs=False, log=None, seed=None, recorder=None, map_preset="medium", map_cache=None,
+                 map=None):
         """ @param player_list List of Player objects 
+            @param verbose If True, events are written to stdout unless a log is given.
             @param interest_rate is in range [0,1]
+            @param use_workers If True, each player runs in its own long-lived process and
+                               take_turn is limited to Timer.TIME seconds. If False, players
+                               run in this process with no time limit.
+            @param vectorised If True, player locations, gold and inventories are kept in a
+                              PlayerTable and charges and scores are computed over all players at once,
+                              and the markets are kept in a MarketBook.
+            @param read_only_inputs If True, players running in this process get read-only views of the
+                                    market information instead of dicts and lists (see turn_inputs).
+            @param log EventLog that game events are written to. If None and verbose,
+                       every event is written to stdout, a turn at a time.
+            @param seed Seed for this game's random.Random, which draws the markets, start locations,
+                        goals, turn order and rumours. The global random module used by the players
+                        is also seeded from it, in each worker or in this process. Drawn from the
+                        system if None; the seed used is kept in self.seed.
+                        Players whose choices depend on the iteration order of sets of str only replay
+                        with PYTHONHASHSEED fixed as well; Player and Player2 sort them first.
+            @param recorder Replay.ReplayRecorder that every state change is recorded to.
+            @param map_preset Name of the map to play on, "small", "medium" or "large" (see Map.MAP_PRESETS).
+            @param map_cache Directory where generated maps are kept between runs, or None to
+                             only reuse them within this process.
+            @param map Map to play on instead of map_preset, eg. one made with Map(...) or Map.load.
+                       The game plays on map.new_circle(), so map itself is not changed.
         """
         self.verbose = verbose
-
-        map_width = 200 # Dimensions of map
-        map_height = 100
-        resolution_x = 2 # Resolution to render the map at
-        resolution_y = 3
-
-        # Game using the simple small map.
-        # node_list = ["Academy", "City", "Gallery", "Junkyard", "Office", "Park", "Stadium", "Tree", "Weather Station"]
-        # self.map = Map(node_list, map_width, map_height, resolution_x, resolution_y, seed=2354)
-
-        # Game using a medium map.
-        node_list = list(string.ascii_uppercase)
-        self.map = Map(node_list, map_width, map_height, resolution_x, resolution_y, seed=23624)
-
-        # Game using a large map.
-        #node_list = list(string.ascii_uppercase) + list(string.ascii_lowercase)
-        #self.map = Map(node_list, map_width, map_height, resolution_x, resolution_y, seed=2360)
-
-        random.seed(time.time())
-        self.markets = {node:Market() for node in self.map.get_node_names()}  # need to randomise markets params BUG!
-
-        self.have_researched = {node:[] for node in self.map.get_node_names()}  # list of player ids that hace researched this node
+        if log is None and verbose:
+            log = EventLog.EventLog(sys.stdout, EventLog.LEVEL_ACTION)
+        self.log = log
+        self.recorder = recorder
+        self.last_grey = ()            # nodes that were grey last turn, and so are black now
+        self.read_only_inputs = read_only_inputs
+        self.use_workers = use_workers
+        self.workers = {}              # key=player id  value=PlayerWorker (only while run_game is running)
+
+        # Map of the game, see Map.MAP_PRESETS.
+        if map is None:
+            self.map = Map.preset(map_preset, cache_dir=map_cache)
+        else:
+            self.map = map.new_circle()
+        # Hop tables are shared with every player's map, make them before the players are forked.
+        # Players in this process make them when first asked, and big maps don't have them.
+        if use_workers and len(self.map.get_node_names()) <= HOP_TABLE_MAX_NODES:
+            self.map.hop_tables()
+
+        if seed is None:
+            seed = random.SystemRandom().getrandbits(64)
+        self.seed = seed
+        self.rng = random.Random(seed)
+
+        if vectorised:
+            self.markets = MarketBook(self.map.get_node_names(), np.random.default_rng(self.rng.getrandbits(64)))  # book[node] behaves like a Market
+        else:
+            self.markets = {node:Market(self.rng) for node in self.map.get_node_names()}  # need to randomise markets params BUG!
+
+        self.have_researched = {node:set() for node in self.map.get_node_names()}  # set of player ids that have researched this node
+        self.located = {node:set() for node in self.map.get_node_names()}  # set of player ids at this node
 
         self.turn_num = 0
         self.num_players = 0           # next player id is this + 1
         self.players = {}              # key=integer index into player_list  value=tuple indexed by INFO_*
+        self.player_seeds = {}         # key=player id  value=seed for the global random module in its worker
+        self.player_random = {}        # key=player id  value=state of the random module in its worker when paused
+        self.random_state = None       # state of this process's random module when paused (use_workers=False)
+        self.table = None              # PlayerTable backing self.players when vectorised
+        if vectorised:
+            self.table = PlayerTable(self.map.get_node_names(), PRODUCTS, INV_GOLD, node_ids=self.map.get_node_ids())
 
         self.interest = interest_rate
 
@@ -85,40 +170,102 @@ class Game:
         assert("set_goal" in [n for n in dir(p) if callable(getattr(p, n))])
         assert("set_map" in [n for n in dir(p) if callable(getattr(p, n))])
 
-        start_loc = random.choice(list(self.map.get_node_names()))
+        start_loc = self.rng.choice(list(self.map.get_node_names()))
         start_inv = {k:0 for k in PRODUCTS}
         start_inv[INV_GOLD] = START_GOLD
 
-        goal = {k:random.randint(v[0],v[1]) for k,v in A_BOUNDS.items()}
+        goal = {k:self.rng.randint(v[0],v[1]) for k,v in A_BOUNDS.items()}
+        self.player_seeds[self.num_players + 1] = self.rng.getrandbits(64)
 
-        self.players[self.num_players + 1] = {INFO_LOC:start_loc, INFO_N:0, INFO_OBJ:p, INFO_INV:start_inv, 
-                                              INFO_HISTORY:[], INFO_GOAL:copy.copy(goal)}
+        if self.table is not None:
+            row = self.table.add(start_loc, START_GOLD, goal)
+            self.players[self.num_players + 1] = PlayerRow(self.table, row, {INFO_OBJ:p, INFO_GOAL:copy.copy(goal),
+                                                                              INFO_HISTORY:deque(maxlen=HISTORY_LENGTH)})
+        else:
+            self.players[self.num_players + 1] = {INFO_LOC:start_loc, INFO_N:0, INFO_OBJ:p, INFO_INV:start_inv, 
+                                                  INFO_HISTORY:deque(maxlen=HISTORY_LENGTH), INFO_GOAL:copy.copy(goal)}
         self.num_players += 1
+        self.located[start_loc].add(self.num_players)
 
         p.set_goal(goal)
         p.set_gold(float(START_GOLD))
-        p.set_map(copy.deepcopy(self.map))
+        p.set_map(self.map.frozen())   # shared by all players, read-only
 
 
     def get_prices_from_other_players(self, p_id):
-        """@return Dictionary node:price_dict, where price_dict = {product:price} as str:float
+        """Sample the research history of every player at p_id's location (self.located).
+           @return Dictionary node:price_dict, where price_dict = {product:price} as str:float
         """
-        players_here = [p_info for p_id,p_info in self.players.items() if p_info[INFO_LOC] == self.players[p_id][INFO_LOC]]
-
         ret_value = {}
-        for p_info in players_here:
-            hist = p_info[INFO_HISTORY]
+        for other_id in sorted(self.located[self.players[p_id][INFO_LOC]]):
+            hist = self.players[other_id][INFO_HISTORY]
             if len(hist) > 0:
-                indexes = [-1] + random.sample(range(len(hist)-1), min(EXCHANGE_LENGTH, len(hist)-1))  # n=0 is ok
+                indexes = [-1] + self.rng.sample(range(len(hist)-1), min(EXCHANGE_LENGTH, len(hist)-1))  # n=0 is ok
                 for i in indexes:
                     ret_value[hist[i]] = self.markets[hist[i]].get_prices()
 
         return ret_value
 
+    def start_workers(self):
+        """Start one worker process per player. The workers fork after add_player has set
+           the goal, gold and map, so each worker owns a fully initialised Player.
+        """
+        if not self.use_workers:
+            return
+        for p_id, p_info in self.players.items():
+            if p_id not in self.workers:
+                self.workers[p_id] = PlayerWorker(p_info[INFO_OBJ], self.player_seeds[p_id], self.player_random.get(p_id))
+                self.workers[p_id].start()
+
+    def fetch_players(self):
+        """Copy the current Player objects back from the workers into self.players.
+        """
+        for p_id, w in self.workers.items():
+            p = w.fetch()
+            self.player_random[p_id] = w.random_state
+            if isinstance(p.map, FrozenMap):
+                p.set_map(self.map.frozen())   # share the map again rather than one copy each
+            self.players[p_id][INFO_OBJ] = p
+
+    def stop_workers(self):
+        for w in self.workers.values():
+            w.close()
+        self.workers = {}
+
+    def take_turn(self, p_id, args):
+        """Ask player p_id for its command.
+           @return (cmd, data) or None if the player exceeded its time budget.
+        """
+        if self.use_workers:
+            return self.workers[p_id].call("take_turn", args)
+        return self.players[p_id][INFO_OBJ].take_turn(*args)
+
+    def emit(self, level, p_id, kind, **fields):
+        """Write an event to the log, see EventLog for the kinds and their fields.
+        """
+        if self.log is not None:
+            self.log.emit(level, self.turn_num, p_id, kind, **fields)
+        if self.recorder is not None:
+            self.recorder.record(self.turn_num, p_id, kind, fields)
+
+    def turn_inputs(self, this_market, other_info, bnodes, gnodes):
+        """Arguments for take_turn after the location, as the dicts and lists BasePlayer.take_turn expects.
+           this_market and other_info are new dictionaries for every call, so they are passed without copying.
+           With read_only_inputs, players in this process get read-only views instead:
+           MappingProxyType for the dictionaries and tuples for the node lists.
+        """
+        if self.read_only_inputs and not self.use_workers:
+            other_view = read_only({node:read_only(prices) for node, prices in other_info.items()})
+            return read_only(this_market), other_view, bnodes, gnodes
+        return this_market, other_info, list(bnodes), list(gnodes)
+
     def game_result(self):
         """For each player, determine their final score.    
            @return List of scores in same order as players list.
         """
+        if self.table is not None:
+            return self.table.scores(GOAL_BONUS)
+
         score = []
         for p_id,p_info in self.players.items():
             met_goals = [p_info[INFO_INV][prod] >= amount for prod,amount in p_info[INFO_GOAL].items()]
@@ -128,40 +275,120 @@ class Game:
 
         return score
 
-    def run_game(self, num_turns=NUM_TURNS):
+    def run_game(self, num_turns=NUM_TURNS, pause_at=None):
         """For each turn, shuffle players and call the take_turn(...).
+           Continues from self.turn_num, so a paused or loaded game resumes where it stopped.
 
+           @param num_turns Length of the whole game.
+           @param pause_at If given, stop after this turn, eg. to save() the game.
            @return List of scores in order players sent to constructuor.
            @return Tuple (player object, error message)
+           @return None if paused at pause_at.
         """
-
-        for turns in range(num_turns):
+        self.start_workers()
+        if not self.use_workers:
+            # Players in this process share the global random module.
+            if self.random_state is None:
+                random.seed(self.seed)
+            else:
+                random.setstate(self.random_state)
+        if self.recorder is not None:
+            self.recorder.start(self)
+        paused = False
+        try:
+            res = self.play_turns(num_turns, num_turns if pause_at is None else min(pause_at, num_turns))
+            paused = res is None
+            if paused:
+                self.fetch_players()
+                if not self.use_workers:
+                    self.random_state = random.getstate()
+            return res
+        finally:
+            self.stop_workers()
+            if self.log is not None:
+                self.log.flush()
+            if self.recorder is not None and not paused:
+                self.recorder.close()
+
+    def save(self, path):
+        """Write a snapshot of the game, normally paused with run_game(pause_at=...).
+           The snapshot holds the map and circle, markets, player table and Player objects,
+           and the random generator; the log and recorder are not saved. The recorder's file is
+           made a complete replay up to now, and it carries on recording if this game goes on.
+        """
+        if self.recorder is not None:
+            self.recorder.checkpoint()
+        with open(path, "wb") as f:
+            f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION))
+            pickler = pickle.Pickler(f, protocol=pickle.HIGHEST_PROTOCOL)
+            # Players may keep the read-only views passed to take_turn.
+            pickler.dispatch_table = {MappingProxyType: lambda view: (read_only, (dict(view),))}
+            pickler.dump(self)
+
+    def load(path, log=None, recorder=None):
+        """@param log EventLog for the loaded game, as in the constructor: if None and the game is verbose,
+                      events are written to stdout.
+           @param recorder Replay.ReplayRecorder for the rest of the game, its replay starts at the saved turn.
+           @return The Game saved in path. Continue it with run_game().
+        """
+        with open(path, "rb") as f:
+            magic, version = SNAPSHOT_HEADER.unpack(f.read(SNAPSHOT_HEADER.size))
+            if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+                raise ValueError("{} is not a version {} game snapshot".format(path, SNAPSHOT_VERSION))
+            game = pickle.load(f)
+        if log is None and game.verbose:
+            log = EventLog.EventLog(sys.stdout, EventLog.LEVEL_ACTION)
+        game.log = log
+        game.recorder = recorder
+        return game
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['workers'] = {}
+        state['log'] = None
+        state['recorder'] = None
+        return state
+
+    def play_turns(self, num_turns, stop_turn):
+        """Play from self.turn_num to stop_turn of a num_turns game.
+           @return As run_game.
+        """
+        while self.turn_num < stop_turn:
             self.turn_num += 1
 
             self.map.move_circle(num_turns)
 
-            node_status = self.map.get_node_status()
-            bnodes = [name for name, status in node_status if status == Map.NODE_STATUS_BLACK]
-            gnodes = [name for name, status in node_status if status == Map.NODE_STATUS_GREY]
-
-            temp = list(self.players.items())
-            random.shuffle(temp)
-            for p_id,p_info in temp:
+            bnodes = tuple(self.map.get_black_nodes())
+            gnodes = tuple(self.map.get_grey_nodes())
 
-                # if self.verbose:
-                    # self.map.render_map()
-                    # self.map.pretty_print_map()
+            if self.log is not None or self.recorder is not None:
+                for node in self.last_grey:
+                    self.emit(EventLog.LEVEL_TURN, None, EventLog.STATUS, node=node, status=Map.NODE_STATUS_BLACK)
+                for node in gnodes:
+                    self.emit(EventLog.LEVEL_TURN, None, EventLog.STATUS, node=node, status=Map.NODE_STATUS_GREY)
+            self.last_grey = gnodes
 
-                msg = []
+            if self.table is not None:
+                charged, outside = self.table.charge(self.interest, bnodes, OUTSIDE_CIRCLE_PENALTY)
 
-                if p_info[INFO_INV][INV_GOLD] < 0:
-                    i = -self.interest * p_info[INFO_INV][INV_GOLD]
-                    msg.append("Interest of {} charged.".format(i))
-                    p_info[INFO_INV][INV_GOLD] -= i
+            temp = list(self.players.items())
+            self.rng.shuffle(temp)
+            for p_id,p_info in temp:
 
-                if self.map.outside_circle(p_info[INFO_LOC]):
-                    msg.append("Outside circle charge {}".format(OUTSIDE_CIRCLE_PENALTY))
-                    p_info[INFO_INV][INV_GOLD] -= OUTSIDE_CIRCLE_PENALTY
+                if self.table is not None:
+                    if charged[p_info.row] > 0:
+                        self.emit(EventLog.LEVEL_TURN, p_id, EventLog.INTEREST, amount=charged[p_info.row])
+                    if outside[p_info.row]:
+                        self.emit(EventLog.LEVEL_TURN, p_id, EventLog.PENALTY, node=p_info[INFO_LOC], amount=OUTSIDE_CIRCLE_PENALTY)
+                else:
+                    if p_info[INFO_INV][INV_GOLD] < 0:
+                        i = -self.interest * p_info[INFO_INV][INV_GOLD]
+                        self.emit(EventLog.LEVEL_TURN, p_id, EventLog.INTEREST, amount=i)
+                        p_info[INFO_INV][INV_GOLD] -= i
+
+                    if self.map.outside_circle(p_info[INFO_LOC]):
+                        self.emit(EventLog.LEVEL_TURN, p_id, EventLog.PENALTY, node=p_info[INFO_LOC], amount=OUTSIDE_CIRCLE_PENALTY)
+                        p_info[INFO_INV][INV_GOLD] -= OUTSIDE_CIRCLE_PENALTY
                     
                 other_info = {}
                 if p_info[INFO_N] == 0:
@@ -171,44 +398,46 @@ class Game:
                 market = self.markets[p_info[INFO_LOC]]
 
                 if p_id in self.have_researched[p_info[INFO_LOC]]:
-                    this_market = copy.deepcopy(market.get_price_amount())
+                    this_market = market.get_price_amount()   # a new dict on every call
                 else:
                     this_market = {}
 
                 try:
                     with silence_stdout():
-                        res = Timer.timeout(p_info[INFO_OBJ].take_turn, (p_info[INFO_LOC], this_market, copy.deepcopy(other_info), bnodes, gnodes))
-                        #res = p_info[INFO_OBJ].take_turn(p_info[INFO_LOC], this_market, copy.deepcopy(other_info), bnodes, gnodes)
+                        res = self.take_turn(p_id, (p_info[INFO_LOC],) + self.turn_inputs(this_market, other_info, bnodes, gnodes))
                         if res is None:
                             raise Exception('Timeout', 'take_turn')
                         cmd,data = res
                 except Exception:
                     return((p_info[INFO_OBJ], traceback.format_exc()))
 
+                inv = p_info[INFO_INV]
                 if cmd == Command.MOVE_TO:
                     assert(type(data) is str)
                     if self.map.is_road(p_info[INFO_LOC], data):
-                        msg.append("Moved from {} to {}".format(p_info[INFO_LOC], data))
+                        self.emit(EventLog.LEVEL_ACTION, p_id, EventLog.MOVE, src=p_info[INFO_LOC], dst=data, gold=inv[INV_GOLD])
+                        self.located[p_info[INFO_LOC]].discard(p_id)
+                        self.located[data].add(p_id)
                         p_info[INFO_LOC] = data
                         p_info[INFO_N] = 0  # no turns in new location
                     else:
-                        msg.append("No Move: {} is not connected to {}".format(data, p_info[INFO_LOC]))
+                        self.emit(EventLog.LEVEL_ACTION, p_id, EventLog.NO_MOVE, src=p_info[INFO_LOC], dst=data, gold=inv[INV_GOLD])
                 elif cmd == Command.BUY:
                     if p_id not in self.have_researched[p_info[INFO_LOC]]:
-                        msg.append(MSG_NO_RESEARCH)
+                        self.emit(EventLog.LEVEL_ACTION, p_id, EventLog.REFUSED, node=p_info[INFO_LOC], reason=MSG_NO_RESEARCH, gold=inv[INV_GOLD])
                     else:
                         if p_info[INFO_INV][INV_GOLD] < 0:
-                            msg.append("Not enough gold to buy anything.")
+                            self.emit(EventLog.LEVEL_ACTION, p_id, EventLog.REFUSED, node=p_info[INFO_LOC], reason=MSG_NO_GOLD, gold=inv[INV_GOLD])
                         else:
                             assert(len(data) == 2)
                             data = list(data)
                             prod,am,cost = market.sell(*data)
                             p_info[INFO_INV][prod] += am
                             p_info[INFO_INV][INV_GOLD] -= cost
-                            msg.append("Bought {} {}".format(am, prod))
+                            self.emit(EventLog.LEVEL_ACTION, p_id, EventLog.BUY, node=p_info[INFO_LOC], product=prod, amount=am, cost=cost, gold=inv[INV_GOLD])
                 elif cmd == Command.SELL:
                     if p_id not in self.have_researched[p_info[INFO_LOC]]:
-                        msg.append(MSG_NO_RESEARCH)
+                        self.emit(EventLog.LEVEL_ACTION, p_id, EventLog.REFUSED, node=p_info[INFO_LOC], reason=MSG_NO_RESEARCH, gold=inv[INV_GOLD])
                     else:
                         assert(len(data) == 2)
                         data = list(data)
@@ -218,20 +447,25 @@ class Game:
                         prod,am,cost = market.buy(*data)
                         p_info[INFO_INV][prod] -= am
                         p_info[INFO_INV][INV_GOLD] += cost
-                        msg.append("Sold {} {}".format(am, prod))
+                        self.emit(EventLog.LEVEL_ACTION, p_id, EventLog.SELL, node=p_info[INFO_LOC], product=prod, amount=am, cost=cost, gold=inv[INV_GOLD])
                 elif cmd == Command.RESEARCH:
                     p_info[INFO_HISTORY].append(p_info[INFO_LOC])
-                    msg.append("Researched at {}".format(p_info[INFO_LOC]))
-                    self.have_researched[p_info[INFO_LOC]].append(p_id)
-
-                if self.verbose:
-                    print("{} {}".format(p_id, msg))
-                    print(f"Player Inventory:{dict(p_info[INFO_OBJ].inventory)}")
-                    print(f"Player Gold:{p_info[INFO_OBJ].gold}")
-            if self.verbose:
-                print(self)
-
-        return self.game_result()
+                    self.emit(EventLog.LEVEL_ACTION, p_id, EventLog.RESEARCH, node=p_info[INFO_LOC], gold=inv[INV_GOLD])
+                    self.have_researched[p_info[INFO_LOC]].add(p_id)
+                elif cmd == Command.PASS:
+                    self.emit(EventLog.LEVEL_ACTION, p_id, EventLog.PASS, node=p_info[INFO_LOC], gold=inv[INV_GOLD])
+
+            if self.recorder is not None:
+                self.recorder.end_turn(self)
+            if self.verbose and self.log is not None:
+                self.log.flush()
+
+        if self.turn_num < num_turns:
+            return None
+
+        scores = self.game_result()
+        self.emit(EventLog.LEVEL_GAME, None, EventLog.END, scores=scores)
+        return scores
             
     def __repr__(self):
         s = "Game: num_players={} turn_num={:4d}\n".format(self.num_players, self.turn_num)
@@ -6,11 +6,32 @@
 #
 
 import random
-from collections import defaultdict
+from collections import defaultdict, deque
+from types import MappingProxyType
+import copy
+import hashlib
+import json
+import os
+import numpy as np
 import string
 
 MIN_CIRCLE_UNSET = -1 # A value for signifying minimum circle parameters have not been set.
 
+MAP_FILE_VERSION = 1
+
+UNREACHABLE = 0xFFFF   # Hop distance and next hop between nodes with no path, see Map.hop_tables
+HOP_TABLE_MAX_NODES = 2048   # Largest map hop_tables are made for, they take 4 bytes per pair of nodes
+
+# Maps that can be used in a Game: (node_list, map_width, map_height, resolution_x, resolution_y, seed)
+MAP_PRESETS = {
+    "small": (["Academy", "City", "Gallery", "Junkyard", "Office", "Park", "Stadium", "Tree", "Weather Station"],
+              200, 100, 2, 3, 2354),
+    "medium": (list(string.ascii_uppercase), 200, 100, 2, 3, 23624),
+    "large": (list(string.ascii_uppercase) + list(string.ascii_lowercase), 200, 100, 2, 3, 2360),
+}
+
+map_memo = {}   # Maps made by Map.cached in this process, key=generation parameters
+
 class Map():
     # Constants for indicating status of circle.
     NODE_STATUS_WHITE = 0
@@ -54,8 +75,6 @@ class Map():
 
         self.init_circle()
 
-        self.render_map()
-
     # Good seeds: (2354), 2360
     def __init__(self, node_list, map_width, map_height, resolution_x, resolution_y, seed=2360):
         '''
@@ -70,10 +89,11 @@ class Map():
         Creates
             self.map_data['node_positions'][String name] = (x, y, circle_status)
             self.map_data['node_graph'][String name] = {n1. n2, ...n mm} # set of reachable node names
+            self.node_status[String name] = circle_status  # current status, updated by move_circle
         '''
 
-        # Seed the random generator.
-        random.seed(seed)
+        # A random generator of our own, so the global random state is left alone.
+        rng = random.Random(seed)
 
         self.map_data = {}
         self.map_width = map_width
@@ -84,7 +104,7 @@ class Map():
         # First maps node_lists onto a 2D map.
         node_positions = {}
         for node in node_list:
-            node_positions[node] = (random.random() * map_width, random.random() * map_height, Map.NODE_STATUS_WHITE)  # all start in circle
+            node_positions[node] = (rng.random() * map_width, rng.random() * map_height, Map.NODE_STATUS_WHITE)  # all start in circle
 
         self.map_data["node_positions"] = node_positions
 
@@ -96,29 +116,12 @@ class Map():
         outgoing_edges_max = 4
         
 
-        for node in node_list:
-            # Find the closest nodes (sorted by closest)
-            #print("Finding closest nodes of " + node + "...")
-            closest_other_nodes = []
-            for other_node in node_list:
-                if node != other_node: # Only calculate distance if not the same node.
-                    (node_x, node_y, _) = node_positions[node]
-                    (other_node_x, other_node_y, _) = node_positions[other_node]
-
-                    dx = (node_x - other_node_x)
-                    dy = (node_y - other_node_y)
-                    distance = (dx ** 2 + dy ** 2) ** 0.5
-                    closest_other_nodes.append((distance, other_node))
-
-            closest_other_nodes.sort() # Sorts nodes from closest to furthest away.
-            #print("Closest other nodes found:", closest_other_nodes)
-            #print()
-            
-            # Generate a random number of outgoing edges, connecting them to closest other nodes.
-            edges_outgoing_for_node = random.randint(outgoing_edges_min, outgoing_edges_max)
-            for edge_i in range(edges_outgoing_for_node):
+        # Generate a random number of outgoing edges per node, connecting them to closest other nodes.
+        edges_outgoing = [rng.randint(outgoing_edges_min, outgoing_edges_max) for node in node_list]
+        closest = Map.closest_nodes(node_list, node_positions, edges_outgoing, map_width, map_height)
+        for node, closest_other_nodes in zip(node_list, closest):
+            for other_node in closest_other_nodes:
                 # Create the relationship to map node to other_node (both ways).
-                other_node = closest_other_nodes[edge_i][1]
                 node_graph[node].add(other_node)
                 node_graph[other_node].add(node)
 
@@ -126,23 +129,47 @@ class Map():
 
         self.init_circle()
 
-        self.render_map()
-
 
     def init_circle(self):
         '''
-        Initializes the circle.
+        Initializes the circle, and the circle status of every node from map_data['node_positions'].
+        The circle state lives here, map_data is not changed as the circle moves.
         '''
+        self.node_status = {node: status for (node, (_, _, status)) in self.map_data['node_positions'].items()}
+        self.grey_nodes = [node for (node, status) in self.node_status.items() if status == Map.NODE_STATUS_GREY]
+        self.black_nodes = [node for (node, status) in self.node_status.items() if status == Map.NODE_STATUS_BLACK]
+        self.circle_turn = 0      # number of calls to move_circle
+        self.schedule = None      # see circle_schedule
         self.circle = {}
         self.circle['y_min'] = 0
         self.circle['y_max'] = self.map_height
         self.circle['x_min'] = 0
         self.circle['x_max'] = self.map_width
 
+    # The number of times each road is sampled when it is drawn.
+    SAMPLING_AMOUNT_PER_LINE = 10
+
+    # The rendered map is only made when it is first used, see render_map.
+    _map_2d = None
+
+    @property
+    def map_2d(self):
+        '''2D NumPy array of single characters, a pretty_printable visualization of the map.'''
+        if self._map_2d is None:
+            self.render_map()
+        return self._map_2d
+
+    @map_2d.setter
+    def map_2d(self, value):
+        self._map_2d = value
+
     def render_map(self):
         '''
         Takes in the self.map_data and produces a map_2d which is a pretty_printable
         visualization of the map.
+
+        Every road is sampled at SAMPLING_AMOUNT_PER_LINE - 1 evenly spaced points between
+        its nodes, all roads at once, and the samples are painted onto a char array.
         '''
 
         node_positions = self.map_data["node_positions"]
@@ -152,74 +179,43 @@ class Map():
         y_blocks = int(self.map_height / self.resolution_y)
 
         # Initialize the map to be empty.
-        self.map_2d = []
-        for y in range(y_blocks):
-            map_row = [] # An individual row of a map.
-            for x in range(x_blocks):
-                map_row.append(Map.EMPTY_ICON)
-            self.map_2d.append(map_row)
-
-        # The number of times we will sample the line to render the path
-        SAMPLING_AMOUNT_PER_LINE = 10
-        # For every node that connects to other_node
+        map_2d = np.full((y_blocks, x_blocks), Map.EMPTY_ICON, dtype='U1')
+
+        # For every node that connects to other_node, the start and end of the road.
         node_graph = self.map_data["node_graph"]
-        for node, other_nodes in node_graph.items():
-            # Sample the edges to render the paths between nodes.
-     
-            for other_node in other_nodes:
-                if node != other_node: # Only c (rise/run) if node not the same.
-                    start_pos = node_positions[node][:2]
-                    end_pos = node_positions[other_node][:2]
-                    (dx, dy) = Map.dx_dy_between_pos(start_pos, end_pos)
-
-                    #c = abs(dy / dx)
-
-                    step_x = abs(dx/SAMPLING_AMOUNT_PER_LINE)
-                    step_y = abs(dy/SAMPLING_AMOUNT_PER_LINE)
-
-                    # Initialize where we start painting the path.
-                    (node_x, node_y) = start_pos
-                    current_path_x = node_x
-                    current_path_y = node_y
-                    # "Paint on" the path for all samples on the path.
-                    distance_left_to_other_node = Map.distance_between_pos(start_pos, end_pos)
-                    (end_x, end_y) = end_pos
-
-                    distance_before_close_enough_to_destination = (step_x ** 2 + step_y ** 2) ** 0.5
-                    while distance_left_to_other_node > distance_before_close_enough_to_destination:
-
-                        # Move toward the end position.
-                        if current_path_x < end_x:
-                            current_path_x += step_x
-                        else:
-                            current_path_x -= step_x
-
-                        if current_path_y < end_y:
-                            current_path_y += step_y #* c
-                        else:
-                            current_path_y -= step_y #* c
-
-                        self.set_map_2d_icon(current_path_x, current_path_y, Map.PATH_ICON)
-                        
-                        distance_left_to_other_node = Map.distance_between_pos((current_path_x, current_path_y), end_pos)
-                        #print(current_path_x, current_path_y, node_positions[other_node], distance_left_to_other_node, STEP_SIZE)
+        roads = [node_positions[node][:2] + node_positions[other_node][:2]
+                 for node, other_nodes in node_graph.items() for other_node in other_nodes if node != other_node]
+        if roads:
+            roads = np.array(roads, dtype=float)
+            t = np.arange(1, Map.SAMPLING_AMOUNT_PER_LINE) / Map.SAMPLING_AMOUNT_PER_LINE
+            xs = roads[:, [0]] + (roads[:, [2]] - roads[:, [0]]) * t
+            ys = roads[:, [1]] + (roads[:, [3]] - roads[:, [1]]) * t
+            Map.paint(map_2d, xs.ravel(), ys.ravel(), Map.PATH_ICON, self.resolution_x, self.resolution_y)
 
         # Update the 2d array to have different icon to represent a point
-        # of interest.
-        for (node, (x, y, node_circle_status)) in node_positions.items():
-            # Sets an icon at the map position, using a the first letter of
-            # the node name.
-            icon_for_node = node[0]
-
-            # If the circle status is grey or black, change the icon.
-            if node_circle_status == Map.NODE_STATUS_GREY:
-                icon_for_node = Map.NODE_STATUS_GREY_ICON
-
-            if node_circle_status == Map.NODE_STATUS_BLACK:
-                icon_for_node = Map.NODE_STATUS_BLACK_ICON
-
-            self.set_map_2d_icon(x, y, icon_for_node)
-
+        # of interest, using the first letter of the node name. If the circle
+        # status is grey or black, change the icon.
+        icons = {Map.NODE_STATUS_GREY: Map.NODE_STATUS_GREY_ICON, Map.NODE_STATUS_BLACK: Map.NODE_STATUS_BLACK_ICON}
+        if node_positions:
+            names = list(node_positions.keys())
+            xs = np.array([node_positions[node][0] for node in names], dtype=float)
+            ys = np.array([node_positions[node][1] for node in names], dtype=float)
+            node_icons = np.array([icons.get(self.node_status[node], node[0]) for node in names], dtype='U1')
+            Map.paint(map_2d, xs, ys, node_icons, self.resolution_x, self.resolution_y)
+
+        self._map_2d = map_2d
+
+    def paint(map_2d, xs, ys, icons, resolution_x, resolution_y):
+        '''
+        Sets icons at positions (xs[i], ys[i]) of a 2D char array, later positions win.
+        Positions out of range are skipped.
+        '''
+        x_block_pos = (xs / resolution_x).astype(np.int64)
+        y_block_pos = (ys / resolution_y).astype(np.int64)
+        inside = (x_block_pos >= 0) & (x_block_pos < map_2d.shape[1]) & (y_block_pos >= 0) & (y_block_pos < map_2d.shape[0])
+        if not np.isscalar(icons):
+            icons = icons[inside]
+        map_2d[y_block_pos[inside], x_block_pos[inside]] = icons
 
     def distance_between_pos(node_pos, other_node_pos):
         '''
@@ -231,6 +227,74 @@ class Map():
 
         return distance
 
+    def closest_nodes(node_list, node_positions, counts, map_width, map_height):
+        '''
+        Finds the closest other nodes of every node, using a uniform grid so each node is
+        only compared with the nodes around it.
+
+        Nodes are ranked by (distance, name), the same as sorting the full list of (distance, name)
+        tuples. The grid search uses NumPy squared distances to find the candidates; the few nearest
+        are then ranked with distance_between_pos so the result does not depend on rounding.
+
+        @param node_list List of node names.
+        @param node_positions {name: (x, y, ...)}
+        @param counts List, number of closest nodes wanted for each node of node_list.
+        @param map_width ...
+        @param map_height ...
+        @return List of lists of node names, closest first, one per node of node_list.
+        '''
+        xs = np.array([node_positions[node][0] for node in node_list], dtype=float)
+        ys = np.array([node_positions[node][1] for node in node_list], dtype=float)
+
+        # About two nodes per cell.
+        cell = max((map_width * map_height * 2 / max(len(node_list), 1)) ** 0.5, 1e-9)
+        grid_w = int(map_width // cell) + 1
+        grid_h = int(map_height // cell) + 1
+        cell_x = np.clip((xs // cell).astype(np.int64), 0, grid_w - 1)
+        cell_y = np.clip((ys // cell).astype(np.int64), 0, grid_h - 1)
+
+        # Node indices sorted by cell, cell c holds order[starts[c]:starts[c + 1]].
+        cell_ids = cell_y * grid_w + cell_x
+        order = np.argsort(cell_ids, kind='stable')
+        starts = np.searchsorted(cell_ids[order], np.arange(grid_w * grid_h + 1)).tolist()
+        order = order.tolist()
+        cell_x = cell_x.tolist()
+        cell_y = cell_y.tolist()
+
+        closest = []
+        for i, node in enumerate(node_list):
+            k = counts[i]
+            x, y = node_positions[node][0], node_positions[node][1]
+
+            # Search a growing square of cells until the k-th nearest candidate is closer than
+            # anything outside the square can be.
+            r = 1
+            while True:
+                x0, x1 = max(cell_x[i] - r, 0), min(cell_x[i] + r, grid_w - 1)
+                y0, y1 = max(cell_y[i] - r, 0), min(cell_y[i] + r, grid_h - 1)
+                candidates = []
+                for row in range(y0, y1 + 1):
+                    candidates += order[starts[row * grid_w + x0]:starts[row * grid_w + x1 + 1]]
+                candidates = np.array([j for j in candidates if node_list[j] != node], dtype=np.int64)
+
+                d2 = (xs[candidates] - x) ** 2 + (ys[candidates] - y) ** 2
+                m = min(k, len(candidates))
+                kth = np.partition(d2, m - 1)[m - 1] * (1 + 1e-9) if m > 0 else 0.0
+
+                edge = min(x - x0 * cell if x0 > 0 else np.inf,
+                           (x1 + 1) * cell - x if x1 < grid_w - 1 else np.inf,
+                           y - y0 * cell if y0 > 0 else np.inf,
+                           (y1 + 1) * cell - y if y1 < grid_h - 1 else np.inf)
+                if edge == np.inf or (m == k and kth < edge * edge):
+                    break
+                r += 1
+
+            ranked = sorted((Map.distance_between_pos((x, y), node_positions[node_list[j]][:2]), node_list[j])
+                            for j in candidates[d2 <= kth].tolist())
+            closest.append([other_node for (_, other_node) in ranked[:k]])
+
+        return closest
+
     def dx_dy_between_pos(node_pos, other_node_pos):
         '''
         Calculates the (dx, dy) between node positions (x, y), (x2, y2).
@@ -307,57 +371,148 @@ class Map():
         Note that this method assumes the circle is decreasing in size, so will not reset any "black"
         nodes to "white".
 
+        The shrink only depends on the parameters, so the turn at which each node turns grey is
+        computed once (see circle_schedule) and each call only updates the nodes that change.
+
         @param num_turns_in_game The number of turns the full game will run for.
         @param min_circle_width Minimum width of the circle. Cirle will not decrease past this size.
         @param min_circle_height Minimum height of the circle. Cirle will not decrease past this size.
         '''
+        schedule = self.circle_schedule(num_turns_in_game, min_circle_width, min_circle_height)
+
+        node_status = self.node_status
+
+        # First, any nodes that are "grey" become "black".
+        for node_name in self.grey_nodes:
+            node_status[node_name] = Map.NODE_STATUS_BLACK
+        self.black_nodes += self.grey_nodes
+        self.grey_nodes = []
 
+        self.circle_turn += 1
+        self.circle = schedule['circles'][min(self.circle_turn, len(schedule['circles']) - 1)].copy()
+
+        # Nodes leaving the circle this turn become grey. Don't change to grey if already black.
+        for node_name in schedule['grey_at'].get(self.circle_turn, []):
+            if node_status[node_name] != Map.NODE_STATUS_BLACK:
+                node_status[node_name] = Map.NODE_STATUS_GREY
+                self.grey_nodes.append(node_name)
+
+    def circle_schedule(self, num_turns_in_game, min_circle_width=MIN_CIRCLE_UNSET, min_circle_height=MIN_CIRCLE_UNSET):
+        '''
+        Computes, from the current circle, the circle after every future call to move_circle with
+        these parameters and the turn at which each node first falls outside it. Kept until
+        move_circle is called with different parameters.
+
+        @return Dictionary with
+            'params'     the parameters it was computed for.
+            'circles'    circles[t] is self.circle after turn t (the last one repeats for later turns).
+            'grey_at'    {turn: [node names that turn grey on that turn]}
+            'grey_turn'  {node name: turn it is grey}, earlier turns for nodes already grey or black.
+        '''
         # If min_circle_width or min_circle_height are MIN_CIRCLE_UNSET, set them to a default value.
         if min_circle_width == MIN_CIRCLE_UNSET:
             min_circle_width = self.map_width/4
         if min_circle_height == MIN_CIRCLE_UNSET:
             min_circle_height = self.map_height/4
 
-        node_positions = self.map_data['node_positions']
-
-        # First, check to see if any nodes are "grey". If so, set them to "black".
-        for (node_name, (node_x, node_y, node_circle_status)) in node_positions.items():
-            #(node_x, node_y, node_circle_status) = node_positions[node_name]
-            
-            if node_circle_status == Map.NODE_STATUS_GREY:
-                node_positions[node_name] = (node_x, node_y, Map.NODE_STATUS_BLACK)
+        params = (num_turns_in_game, min_circle_width, min_circle_height)
+        if self.schedule is not None and self.schedule['params'] == params:
+            return self.schedule
 
         # Decrease the circle. The decrease in rate by a factor of 2 is because we decrease from both directions
         # at once, which doubles the rate of decrease. This is to offset that.
         circle_decrease_amount_x_per_turn = (self.map_width / 2) / num_turns_in_game
         circle_decrease_amount_y_per_turn = (self.map_height / 2) / num_turns_in_game
 
-        self.circle['x_min'] += circle_decrease_amount_x_per_turn
-        self.circle['x_max'] -= circle_decrease_amount_x_per_turn
-        self.circle['y_min'] += circle_decrease_amount_y_per_turn
-        self.circle['y_max'] -= circle_decrease_amount_y_per_turn
+        # Step the circle exactly as it used to be stepped every turn, until it stops changing.
+        circles = [None] * self.circle_turn + [dict(self.circle)]
+        while len(circles) <= self.circle_turn + 1 or (circles[-1] != circles[-2] and len(circles) < self.circle_turn + 4 * num_turns_in_game):
+            circle = dict(circles[-1])
+            circle['x_min'] += circle_decrease_amount_x_per_turn
+            circle['x_max'] -= circle_decrease_amount_x_per_turn
+            circle['y_min'] += circle_decrease_amount_y_per_turn
+            circle['y_max'] -= circle_decrease_amount_y_per_turn
+
+            # Cap circle at minimum size.
+            if circle['x_max'] - circle['x_min'] < min_circle_width:
+                circle['x_min'] = (self.map_width / 2) - min_circle_width / 2
+                circle['x_max'] = (self.map_width / 2) + min_circle_width / 2
+
+            if circle['y_max'] - circle['y_min'] < min_circle_height:
+                circle['y_min'] = (self.map_height / 2) - min_circle_height / 2
+                circle['y_max'] = (self.map_height / 2) + min_circle_height / 2
+
+            circles.append(circle)
+
+        # The circle only shrinks, so the first future turn a node is outside it is found by binary search
+        # on each edge. Checks for left, right, up, down edges of circle.
+        future = circles[self.circle_turn + 1:]
+        names = list(self.map_data['node_positions'].keys())
+        xs = np.array([self.map_data['node_positions'][n][0] for n in names])
+        ys = np.array([self.map_data['node_positions'][n][1] for n in names])
+        first_out = np.minimum.reduce([
+            np.searchsorted(np.array([c['x_min'] for c in future]), xs, side='left'),
+            np.searchsorted(np.array([-c['x_max'] for c in future]), -xs, side='left'),
+            np.searchsorted(np.array([c['y_min'] for c in future]), ys, side='left'),
+            np.searchsorted(np.array([-c['y_max'] for c in future]), -ys, side='left')])
+
+        grey_at = defaultdict(list)
+        grey_turn = {}
+        for node_name, i in zip(names, first_out.tolist()):
+            if self.node_status[node_name] == Map.NODE_STATUS_BLACK:
+                grey_turn[node_name] = -1
+            elif self.node_status[node_name] == Map.NODE_STATUS_GREY:
+                grey_turn[node_name] = self.circle_turn
+            elif i < len(future):
+                grey_turn[node_name] = self.circle_turn + 1 + i
+                grey_at[self.circle_turn + 1 + i].append(node_name)
+            else:
+                grey_turn[node_name] = None
+
+        self.schedule = {'params': params, 'circles': circles, 'grey_at': dict(grey_at), 'grey_turn': grey_turn}
+        return self.schedule
+
+    def status_at(self, node, turn, num_turns_in_game=None):
+        '''
+        @param node str name of node.
+        @param turn Turn number, the status after that many calls to move_circle.
+        @param num_turns_in_game Parameter of move_circle; if None, the schedule from the last call is used.
+        @return Map.NODE_STATUS_* of node on that turn. Turns before the schedule was made are not known
+                and are reported as if the node had always been in its status at that time.
+        '''
+        if num_turns_in_game is not None:
+            schedule = self.circle_schedule(num_turns_in_game)
+        elif self.schedule is not None:
+            schedule = self.schedule
+        else:
+            raise ValueError("no circle schedule yet, give num_turns_in_game")
+
+        g = schedule['grey_turn'][node]
+        if g is None or turn < g:
+            return Map.NODE_STATUS_WHITE
+        if turn == g:
+            return Map.NODE_STATUS_GREY
+        return Map.NODE_STATUS_BLACK
+
+    def get_node_names(self):
+        """@return tuple of node names, in node id order. The same tuple is returned on every call.
+        """
+        return self.node_tables()['names']
 
-        # Cap circle at minimum size.
-        if self.circle['x_max'] - self.circle['x_min'] < min_circle_width:
-            self.circle['x_min'] = (self.map_width / 2) - min_circle_width / 2
-            self.circle['x_max'] = (self.map_width / 2) + min_circle_width / 2
+    def get_node_ids(self):
+        """@return read-only mapping {node name: node id}.
+        """
+        return MappingProxyType(self.node_tables()['index'])
 
-        if self.circle['y_max'] - self.circle['y_min'] < min_circle_height:
-            self.circle['y_min'] = (self.map_height / 2) - min_circle_height / 2
-            self.circle['y_max'] = (self.map_height / 2) + min_circle_height / 2
+    def node_id(self, node): return self.node_tables()['index'][node]
 
-        # For each node, check to see if they will be within the new circle.
-        for node_name in node_positions.keys():
-            (node_x, node_y, node_circle_status) = node_positions[node_name]
-            
-            # Checks for left, right, up, down edges of circle.
-            if node_x <= self.circle['x_min'] or node_x >= self.circle['x_max'] or node_y <= self.circle['y_min'] or node_y >= self.circle['y_max']:
-                
-                if node_circle_status != Map.NODE_STATUS_BLACK:
-                    # Outside circle. Set the node to grey. Don't change to grey if already black.
-                    node_positions[node_name] = (node_x, node_y, Map.NODE_STATUS_GREY)
+    def node_name(self, node_id): return self.node_tables()['names'][node_id]
 
-    def get_node_names(self): return list(self.map_data['node_positions'].keys())
+    def get_adjacency(self):
+        """@return (offsets, indices) CSR adjacency of node ids, see node_tables.
+        """
+        tables = self.node_tables()
+        return tables['offsets'], tables['indices']
 
     def get_neighbours(self, node): 
         """@param node str name of node/location in map
@@ -376,14 +531,297 @@ class Map():
     def outside_circle(self, node): 
         """@return True if node does not exist, or is outside circle. False otherwise.
         """
-        if node not in self.map_data['node_positions']:
+        if node not in self.node_status:
             return True
-        return self.map_data['node_positions'][node][2] == Map.NODE_STATUS_BLACK
+        return self.node_status[node] == Map.NODE_STATUS_BLACK
 
     def get_node_status(self):
         """@return list of (node_name, status) tuples.
         """
-        return [(node, color) for (node, (_, _, color)) in self.map_data['node_positions'].items()]
+        return list(self.node_status.items())
+
+    def get_grey_nodes(self):
+        """@return list of names of the grey nodes.
+        """
+        return list(self.grey_nodes)
+
+    def get_black_nodes(self):
+        """@return list of names of the black nodes, in the order they turned black.
+        """
+        return list(self.black_nodes)
+
+    def node_tables(self):
+        """Integer ids of the nodes and the roads between them as a CSR adjacency, made on first use
+           and shared like hop_tables.
+
+           Node ids are 0..n-1 in the order of map_data['node_positions']. The neighbours of node i are
+           indices[offsets[i]:offsets[i + 1]], in increasing id order.
+
+           @return dictionary with 'names' (tuple, id -> name), 'index' {name: id},
+                   'offsets' (n + 1 int32 array) and 'indices' (int32 array).
+        """
+        tables = self.shared_tables()
+        if 'offsets' not in tables:
+            names = tuple(self.map_data['node_positions'].keys())
+            index = {node: i for i, node in enumerate(names)}
+            graph = self.map_data['node_graph']
+            neighbours = [sorted(index[other] for other in graph.get(node, ()) if other in index) for node in names]
+
+            offsets = np.zeros(len(names) + 1, dtype=np.int32)
+            offsets[1:] = np.cumsum([len(others) for others in neighbours])
+            indices = np.array([other for others in neighbours for other in others], dtype=np.int32)
+
+            tables.update(names=names, index=index, offsets=offsets, indices=indices)
+        return tables
+
+    def hop_tables(self):
+        """Hop distance and next hop between every pair of nodes, made on first use and shared
+           with frozen() (and the other maps from Map.cached).
+
+           dist[a, b] is the number of roads on a shortest path from node id a to node id b, and
+           next_hop[a, b] the first node after a on it (next_hop[a, a] is a). Both are UNREACHABLE
+           if there is no path. Ties are broken towards the neighbour with the lowest id.
+
+           @return dictionary with the node_tables, and 'dist' and 'next_hop' (n x n uint16 arrays).
+           @raise ValueError if the map has more than HOP_TABLE_MAX_NODES nodes.
+        """
+        tables = self.node_tables()
+        if 'dist' not in tables:
+            n = len(tables['names'])
+            assert(n < UNREACHABLE)
+            if n > HOP_TABLE_MAX_NODES:
+                raise ValueError("hop tables are only made for maps of up to {} nodes, not {}".format(HOP_TABLE_MAX_NODES, n))
+            offsets = tables['offsets'].tolist()
+            indices = tables['indices'].tolist()
+
+            dist = np.full((n, n), UNREACHABLE, dtype=np.uint16)
+            next_hop = np.full((n, n), UNREACHABLE, dtype=np.uint16)
+            for source in range(n):
+                # Roads go both ways, so the BFS parent of a node is its next hop towards source.
+                # Each level is searched in id order, so the parent is the lowest id neighbour one hop closer.
+                d = [UNREACHABLE] * n
+                parent = [UNREACHABLE] * n
+                d[source] = 0
+                parent[source] = source
+                frontier = [source]
+                while frontier:
+                    next_frontier = []
+                    for current in frontier:
+                        for other in indices[offsets[current]:offsets[current + 1]]:
+                            if d[other] == UNREACHABLE:
+                                d[other] = d[current] + 1
+                                parent[other] = current
+                                next_frontier.append(other)
+                    frontier = sorted(next_frontier)
+                dist[:, source] = d
+                next_hop[:, source] = parent
+
+            tables.update(dist=dist, next_hop=next_hop)
+        return tables
+
+    def shared_tables(self):
+        """@return dictionary of tables computed from the roads, shared by every map with the same roads.
+        """
+        if getattr(self, '_tables', None) is None:
+            self._tables = {}
+        return self._tables
+
+    def distance(self, a, b):
+        """@return Number of moves to get from node a to node b, or None if b can't be reached.
+           @raise ValueError if the map is too big for hop_tables.
+        """
+        tables = self.hop_tables()
+        d = tables['dist'][tables['index'][a], tables['index'][b]]
+        return None if d == UNREACHABLE else int(d)
+
+    def next_hop(self, a, b):
+        """@return Neighbour of a to move to on a shortest path to b, or None if a is b or b can't be reached.
+           @raise ValueError if the map is too big for hop_tables.
+        """
+        tables = self.hop_tables()
+        i = tables['index'][a]
+        hop = tables['next_hop'][i, tables['index'][b]]
+        if hop == UNREACHABLE or hop == i:
+            return None
+        return tables['names'][hop]
+
+    def path(self, a, b):
+        """@return deque of the nodes on a shortest path from a to b, both included, or None if b can't be reached.
+           @raise ValueError if the map is too big for hop_tables.
+        """
+        tables = self.hop_tables()
+        names = tables['names']
+        next_hop = tables['next_hop']
+        i, j = tables['index'][a], tables['index'][b]
+        if next_hop[i, j] == UNREACHABLE:
+            return None
+        path = deque([a])
+        while i != j:
+            i = int(next_hop[i, j])
+            path.append(names[i])
+        return path
+
+    def frozen(self):
+        """@return A read-only FrozenMap of this map. The same FrozenMap is returned on every call,
+                   so all players can share one copy of the topology.
+        """
+        if getattr(self, '_frozen', None) is None:
+            self._frozen = FrozenMap(self)
+        return self._frozen
+
+    def copy(self):
+        """@return An independent, mutable copy of this map.
+        """
+        m = copy.copy(self)
+        m._frozen = None
+        m._tables = None
+        return copy.deepcopy(m)
+
+    def from_data(node_positions, node_graph, map_width, map_height, resolution_x, resolution_y):
+        '''
+        Sets up a Map from pre-generated node_positions and node_graph, without generating
+        or rendering anything.
+
+        @param node_positions {name: (x, y, circle_status)}
+        @param node_graph {name: set of names}
+        @return Map
+        '''
+        m = Map.__new__(Map)
+        m.map_width = map_width
+        m.map_height = map_height
+        m.resolution_x = resolution_x
+        m.resolution_y = resolution_y
+        m.map_data = {'node_positions': node_positions, 'node_graph': node_graph}
+        m.init_circle()
+        return m
+
+    def save(self, path):
+        '''
+        Writes the map (dimensions, node positions and roads) to a JSON file, see Map.load.
+        The circle state is not saved.
+        '''
+        data = {'version': MAP_FILE_VERSION,
+                'map_width': self.map_width,
+                'map_height': self.map_height,
+                'resolution_x': self.resolution_x,
+                'resolution_y': self.resolution_y,
+                'node_positions': {node: list(pos) for (node, pos) in self.map_data['node_positions'].items()},
+                'node_graph': {node: list(others) for (node, others) in self.map_data['node_graph'].items()}}
+        with open(path, 'w') as f:
+            json.dump(data, f)
+
+    def load(path):
+        '''
+        @return Map read from a file written by Map.save.
+        '''
+        with open(path) as f:
+            data = json.load(f)
+        if data.get('version') != MAP_FILE_VERSION:
+            raise ValueError("{} is not a version {} map file".format(path, MAP_FILE_VERSION))
+        node_positions = {node: tuple(pos) for (node, pos) in data['node_positions'].items()}
+        node_graph = defaultdict(set, {node: set(others) for (node, others) in data['node_graph'].items()})
+        return Map.from_data(node_positions, node_graph, data['map_width'], data['map_height'],
+                             data['resolution_x'], data['resolution_y'])
+
+    def cached(node_list, map_width, map_height, resolution_x, resolution_y, seed, cache_dir=None):
+        '''
+        Same map as Map(node_list, map_width, map_height, resolution_x, resolution_y, seed), but
+        generated only once per process and, if cache_dir is given, only once per cache_dir.
+
+        Each call returns a new Map with its own circle. The node positions, roads and
+        frozen() map are shared between the maps, they are never changed.
+
+        @param cache_dir Directory to keep map files in, or None to keep them in memory only.
+        @return Map
+        '''
+        key = (tuple(node_list), map_width, map_height, resolution_x, resolution_y, seed)
+        if key not in map_memo:
+            path = None
+            if cache_dir is not None:
+                name = hashlib.sha1(json.dumps(key).encode()).hexdigest()
+                path = os.path.join(cache_dir, "map-{}.json".format(name))
+
+            if path is not None and os.path.exists(path):
+                m = Map.load(path)
+            else:
+                m = Map(node_list, map_width, map_height, resolution_x, resolution_y, seed=seed)
+                if path is not None:
+                    os.makedirs(cache_dir, exist_ok=True)
+                    # Write then rename, so other processes never read half a file.
+                    tmp = "{}.{}".format(path, os.getpid())
+                    m.save(tmp)
+                    os.replace(tmp, path)
+            map_memo[key] = m
+
+        return map_memo[key].new_circle()
+
+    def new_circle(self):
+        '''
+        @return A Map with its own circle, sharing the node positions, roads, frozen() map and
+                tables with this map, which are never changed.
+        '''
+        m = Map.from_data(self.map_data['node_positions'], self.map_data['node_graph'], self.map_width, self.map_height,
+                          self.resolution_x, self.resolution_y)
+        m._frozen = self.frozen()
+        m._tables = self.shared_tables()
+        return m
+
+    def preset(name, cache_dir=None):
+        '''
+        @param name Key of MAP_PRESETS, "small", "medium" or "large".
+        @return Map, see Map.cached.
+        '''
+        return Map.cached(*MAP_PRESETS[name], cache_dir=cache_dir)
+
+
+class FrozenMap(Map):
+    """
+    Read-only view of a Map: node positions, roads and the rendered map, with every
+    node in its initial (white) circle status. Safe to share between players.
+    Use copy() to get a mutable Map.
+    """
+    def __init__(self, source):
+        self.map_width = source.map_width
+        self.map_height = source.map_height
+        self.resolution_x = source.resolution_x
+        self.resolution_y = source.resolution_y
+
+        positions = source.map_data['node_positions']
+        graph = source.map_data['node_graph']
+        self.map_data = MappingProxyType({
+            'node_positions': MappingProxyType({node: (x, y, Map.NODE_STATUS_WHITE) for (node, (x, y, _)) in positions.items()}),
+            'node_graph': MappingProxyType({node: frozenset(others) for (node, others) in graph.items()}),
+        })
+
+        self._tables = source.shared_tables()
+
+        Map.init_circle(self)
+        self.node_status = MappingProxyType(self.node_status)
+        self.circle = MappingProxyType(self.circle)
+
+    @property
+    def map_2d(self):
+        '''Rendered map, as a tuple of strings, made on first use.'''
+        if self._map_2d is None:
+            Map.render_map(self)
+            self._map_2d = tuple("".join(row) for row in self._map_2d)
+        return self._map_2d
+
+    def init_circle(self): raise TypeError("FrozenMap is read-only, use copy()")
+    def render_map(self): raise TypeError("FrozenMap is read-only, use copy()")
+    def move_circle(self, *args, **kwargs): raise TypeError("FrozenMap is read-only, use copy()")
+    def frozen(self): return self
+
+    def __reduce__(self):
+        # The read-only mappings cannot be pickled, so rebuild from a mutable copy.
+        return (FrozenMap, (self.copy(),))
+
+    def copy(self):
+        """@return A mutable Map with the same topology.
+        """
+        return Map.from_data(dict(self.map_data['node_positions']),
+                             defaultdict(set, {node: set(others) for (node, others) in self.map_data['node_graph'].items()}),
+                             self.map_width, self.map_height, self.resolution_x, self.resolution_y)
 
 if __name__ == "__main__":
 
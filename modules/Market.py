@@ -6,6 +6,7 @@
     Sat 11 Apr 2020 17:51:25 AEST
 """
 import random
+import numpy as np
 
     # tuples are min and max prices
 PRODUCTS = ['Food', 'Electronics', 'Social', 'Hardware']
@@ -13,8 +14,10 @@ P_BOUNDS = {'Food':(80,120), 'Electronics':(200,1000), 'Social':(20,80), 'Hardwa
 A_BOUNDS = {'Food':(50,100), 'Electronics':(5,30), 'Social':(10,200), 'Hardware':(1,5)} # price bounds
 
 class Market:
-    def __init__(self):
-        self.prices = {k:random.randint(v[0],v[1]) for k,v in P_BOUNDS.items()}   # price of each key
+    def __init__(self, rng=random):
+        """ @param rng random.Random (or the random module) used to draw the prices.
+        """
+        self.prices = {k:rng.randint(v[0],v[1]) for k,v in P_BOUNDS.items()}   # price of each key
         #self.amounts = {k:random.randint(v[0],v[1]) for k,v in A_BOUNDS.items()}   # amount of each key
         self.amounts = {k:7*v[1] for k,v in A_BOUNDS.items()}   # amount of each key
 
@@ -41,3 +44,88 @@ class Market:
             return (product, 0, 0)
         self.amounts[product] += amount
         return (product, amount, self.prices[product] * amount)
+
+
+class MarketBook:
+    """All the markets of a map in two node x product matrices, prices and amounts.
+       Rows follow the order of nodes, columns the order of PRODUCTS.
+       book[node] returns a MarketView with the same methods as Market.
+    """
+    def __init__(self, nodes, rng=None):
+        """ @param nodes List of node names.
+            @param rng numpy Generator used to draw prices, seeded from random if not given.
+        """
+        if rng is None:
+            rng = np.random.default_rng(random.getrandbits(64))
+        self.nodes = list(nodes)
+        self.node_index = {node:i for i,node in enumerate(self.nodes)}
+        self.product_index = {prod:i for i,prod in enumerate(PRODUCTS)}
+
+        low = np.array([P_BOUNDS[k][0] for k in PRODUCTS])
+        high = np.array([P_BOUNDS[k][1] for k in PRODUCTS])
+        self.prices = rng.integers(low, high + 1, size=(len(self.nodes), len(PRODUCTS)), dtype=np.int64)
+        self.amounts = np.tile(np.array([7*A_BOUNDS[k][1] for k in PRODUCTS], dtype=np.int64), (len(self.nodes), 1))
+
+    def __getitem__(self, node): return MarketView(self, self.node_index[node])
+    def __contains__(self, node): return node in self.node_index
+    def __len__(self): return len(self.nodes)
+
+    def get_prices(self, node): return dict(zip(PRODUCTS, self.prices[self.node_index[node]].tolist()))
+    def get_price_amount(self, node):
+        i = self.node_index[node]
+        return dict(zip(PRODUCTS, zip(self.prices[i].tolist(), self.amounts[i].tolist())))
+
+    def sell(self, nodes, products, amounts):
+        """Sell amounts[j] of products[j] at nodes[j], up to the stock held, for every j at once.
+           The (node, product) pairs must be distinct.
+           @param nodes, products, amounts Arrays of node indexes, product indexes and ints.
+           @return (amounts sold, cost) arrays.
+        """
+        nodes, products = np.asarray(nodes), np.asarray(products)
+        a = np.clip(np.asarray(amounts), 0, None)
+        a = np.minimum(a, self.amounts[nodes, products])
+        self.amounts[nodes, products] -= a
+        return a, self.prices[nodes, products] * a
+
+    def buy(self, nodes, products, amounts):
+        """Buy amounts[j] of products[j] at nodes[j] for every j at once - no restrictions.
+           @return (amounts bought, cost) arrays.
+        """
+        nodes, products = np.asarray(nodes), np.asarray(products)
+        a = np.clip(np.asarray(amounts), 0, None)
+        np.add.at(self.amounts, (nodes, products), a)
+        return a, self.prices[nodes, products] * a
+
+
+class MarketView:
+    """One row of a MarketBook with the interface of Market.
+    """
+    def __init__(self, book, i):
+        self.book = book
+        self.i = i
+
+    def get_prices(self): return dict(zip(PRODUCTS, self.book.prices[self.i].tolist()))
+    def get_price_amount(self): return dict(zip(PRODUCTS, zip(self.book.prices[self.i].tolist(), self.book.amounts[self.i].tolist())))
+
+    def sell(self, product, amount):
+        """Sell amount up to as much as I have and return the product and amount sold & cost.
+        """
+        assert(product in PRODUCTS)
+        assert(type(amount) is int)
+        if amount < 0:
+            return (product, 0, 0)
+        k = self.book.product_index[product]
+        a = min(amount, int(self.book.amounts[self.i, k]))
+        self.book.amounts[self.i, k] -= a
+        return (product, a, int(self.book.prices[self.i, k]) * a)
+
+    def buy(self, product, amount):
+        """Buy whatever - no restrictions. @return product and amount and cash.
+        """
+        assert(product in PRODUCTS)
+        assert(type(amount) is int)
+        if amount < 0:
+            return (product, 0, 0)
+        k = self.book.product_index[product]
+        self.book.amounts[self.i, k] += amount
+        return (product, amount, int(self.book.prices[self.i, k]) * amount)
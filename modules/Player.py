@@ -24,6 +24,9 @@ To maximise profits, the player will visit the markets that have products for sa
 of prices of markets known. The player will then visit the markets that will buy the products with prices over 75th
 percentile of prices of markets known.
 
+Before the last third of the game, the player instead trades along the route that makes the most profit per turn,
+out of every pair of known markets and every product, and only falls back on the percentiles without one.
+
 The statistics of the market will update every turn as the player gains more information from passing players.
 
 The player will also blacklist markets that have nothing for sale of a given product to inform decision making.
@@ -108,9 +111,274 @@ from BasePlayer import BasePlayer
 from collections import defaultdict, deque
 import random
 import math
-import copy
+import bisect
 import numpy as np
 
+UNREACHABLE = 0xFFFF    # hop distance of markets with no path between them, see Map.hop_tables
+
+
+def no_stock():
+    """Default inventory entry (amount, asset_cost). A named function so that players can be pickled."""
+    return 0, 0
+
+
+class PriceStats:
+    """Prices of each product across a set of markets, kept sorted with running sums so that
+    markets can be added and removed one at a time.
+    Variance is the population variance (as np.var) and percentiles use linear interpolation
+    (as np.percentile).
+    """
+    def __init__(self):
+        self.prices = defaultdict(list)       # sorted prices of each product: {product: [price, ..]}
+        self.sums = defaultdict(int)          # {product: sum of prices}
+        self.sq_sums = defaultdict(int)       # {product: sum of squared prices}
+        self.markets = {}                     # markets included: {market: (prices dict, {product: price})}
+
+    def add(self, market, prices):
+        """Include the prices of a market, replacing any previous prices of that market.
+        Args:
+            market (str): market name
+            prices (dict): {product: (price, amount)}
+        """
+        if market in self.markets:
+            self.remove(market)
+        included = {product: info[0] for product, info in prices.items()}
+        for product, price in included.items():
+            bisect.insort(self.prices[product], price)
+            self.sums[product] += price
+            self.sq_sums[product] += price * price
+        self.markets[market] = (prices, included)
+
+    def remove(self, market):
+        """Remove the prices of a market.
+        Args:
+            market (str): market name, must have been added
+        """
+        _, included = self.markets.pop(market)
+        for product, price in included.items():
+            prices = self.prices[product]
+            del prices[bisect.bisect_left(prices, price)]
+            self.sums[product] -= price
+            self.sq_sums[product] -= price * price
+            if not prices:
+                del self.prices[product], self.sums[product], self.sq_sums[product]
+
+    def update(self, market_prices, markets):
+        """Include exactly the given markets, with their prices in market_prices.
+        A market is only added again if its prices dict in market_prices was replaced.
+        Args:
+            market_prices (dict): {market: {product: (price, amount)}}
+            markets (set): markets to include
+        """
+        for market in [market for market in self.markets if market not in markets]:
+            self.remove(market)
+        for market in markets:
+            included = self.markets.get(market)
+            if included is None or included[0] is not market_prices[market]:
+                self.add(market, market_prices[market])
+
+    def products(self):
+        return self.prices.keys()
+
+    def var(self, product):
+        """Output:
+            var (float): population variance of the prices of product
+        """
+        n = len(self.prices[product])
+        return (n * self.sq_sums[product] - self.sums[product] ** 2) / (n * n)
+
+    def percentile(self, product, q):
+        """Output:
+            price (float): q-th percentile of the prices of product, linearly interpolated
+        """
+        prices = self.prices[product]
+        index = (len(prices) - 1) * (q / 100)
+        lo = math.floor(index)
+        hi = min(lo + 1, len(prices) - 1)
+        t = index - lo
+        a, b = float(prices[lo]), float(prices[hi])
+        if t >= 0.5:
+            return b - (b - a) * (1 - t)
+        return a + (b - a) * t
+
+
+class MarketKnowledge:
+    """Known prices as markets x products matrices, synced from Player.market_prices.
+    Rows are markets in the order they were first learned about, columns products.
+    Unknown prices and amounts are NaN (rumours have prices but no amounts). For every market
+    the turn its information was learned and its source (SOURCE_*) are also kept.
+    """
+    SOURCE_UNKNOWN = 0
+    SOURCE_SEEN = 1       # the player was at the market
+    SOURCE_RUMOUR = 2     # another player told us the prices
+
+    def __init__(self, capacity=32):
+        self.markets = []                     # row -> market
+        self.index = {}                       # market -> row
+        self.products = []                    # column -> product
+        self.columns = {}                     # product -> column
+        self.rows_from = []                   # row -> the market_prices dict the row was made from
+        self.price = np.full((capacity, 0), np.nan)
+        self.amount = np.full((capacity, 0), np.nan)
+        self.observed = np.full(capacity, -1, dtype=np.int32)
+        self.source = np.zeros(capacity, dtype=np.int8)
+
+    def sync(self, market_prices, turn, markets=None):
+        """Update the rows of markets whose prices dict in market_prices was replaced.
+        Args:
+            market_prices (dict): {market: {product: (price, amount)}}
+            turn (int): turn the new information was learned
+            markets (iterable): the markets that may have changed, all of market_prices if None
+        """
+        if markets is None:
+            markets = market_prices.keys()
+        for market in markets:
+            prices = market_prices[market]
+            row = self.index.get(market)
+            if row is None:
+                row = self.add_market(market)
+            elif self.rows_from[row] is prices:
+                continue
+            self.rows_from[row] = prices
+
+            self.price[row] = np.nan
+            self.amount[row] = np.nan
+            rumour = False
+            for product, (price, amount) in prices.items():
+                col = self.columns.get(product)
+                if col is None:
+                    col = self.add_product(product)
+                self.price[row, col] = price
+                if amount is None:
+                    rumour = True
+                else:
+                    self.amount[row, col] = amount
+            self.observed[row] = turn
+            self.source[row] = MarketKnowledge.SOURCE_RUMOUR if rumour else MarketKnowledge.SOURCE_SEEN
+
+    def add_market(self, market):
+        row = len(self.markets)
+        if row == len(self.observed):
+            grow = max(row, 1)
+            self.price = np.concatenate([self.price, np.full((grow, self.price.shape[1]), np.nan)])
+            self.amount = np.concatenate([self.amount, np.full((grow, self.amount.shape[1]), np.nan)])
+            self.observed = np.concatenate([self.observed, np.full(grow, -1, dtype=self.observed.dtype)])
+            self.source = np.concatenate([self.source, np.zeros(grow, dtype=self.source.dtype)])
+        self.markets.append(market)
+        self.index[market] = row
+        self.rows_from.append(None)
+        return row
+
+    def add_product(self, product):
+        col = len(self.products)
+        self.price = np.concatenate([self.price, np.full((len(self.price), 1), np.nan)], axis=1)
+        self.amount = np.concatenate([self.amount, np.full((len(self.amount), 1), np.nan)], axis=1)
+        self.products.append(product)
+        self.columns[product] = col
+        return col
+
+    def mask(self, markets):
+        """Output:
+            mask (np.array): bool per row, True for the rows of the given markets
+        """
+        mask = np.zeros(len(self.markets), dtype=bool)
+        rows = [self.index[market] for market in markets if market in self.index]
+        mask[rows] = True
+        return mask
+
+    def prices_of(self, products):
+        """Output:
+            prices (np.array): known markets x products price matrix, NaN where unknown
+        """
+        prices = np.full((len(self.markets), len(products)), np.nan)
+        known = [(i, self.columns[product]) for i, product in enumerate(products) if product in self.columns]
+        if known:
+            i, cols = zip(*known)
+            prices[:, list(i)] = self.price[:len(self.markets)][:, list(cols)]
+        return prices
+
+
+class Ledger(dict):
+    """Inventory {product: (amount, asset_cost)} that keeps, as it is updated, the number of
+    products present that meet the goal and the total asset cost. A product that is read but not
+    present is added as no_stock(), like a defaultdict(no_stock).
+    The *_if methods evaluate a hypothetical buy or sell in O(1) without copying the inventory.
+    """
+    goal = None         # goal the met count is for: {product: amount}
+    met = 0             # number of products present with amount >= goal amount
+    total_cost = 0      # sum of the asset costs of all products
+
+    def __init__(self, inventory=(), goal=None):
+        """
+        Args:
+            inventory (dict): starting inventory {product: (amount, asset_cost)}
+            goal (dict): goal to count, see bind
+        """
+        super().__init__()
+        for product, info in dict(inventory).items():
+            self[product] = info
+        self.bind(goal)
+
+    def __reduce__(self):
+        # Rebuild through __init__ so the counts are made once, whatever order copy and pickle restore in.
+        return Ledger, (dict(self), self.goal)
+
+    def __missing__(self, product):
+        self[product] = no_stock()
+        return self[product]
+
+    def __setitem__(self, product, info):
+        old = self.get(product)
+        if old is not None:
+            self.met -= self.meets(product, old[0])
+            self.total_cost -= old[1]
+        dict.__setitem__(self, product, info)
+        self.met += self.meets(product, info[0])
+        self.total_cost += info[1]
+
+    def __delitem__(self, product):
+        old = self[product]
+        self.met -= self.meets(product, old[0])
+        self.total_cost -= old[1]
+        dict.__delitem__(self, product)
+
+    def bind(self, goal):
+        """Count the products that meet this goal from now on.
+        Args:
+            goal (dict): {product: amount}
+        """
+        if goal is not self.goal:
+            self.goal = goal
+            self.met = sum(self.meets(product, info[0]) for product, info in self.items())
+
+    def meets(self, product, amount):
+        return self.goal is not None and amount >= self.goal.get(product, math.inf)
+
+    def met_if(self, product, amount):
+        """Output:
+            met (int): number of products meeting the goal if product had this amount.
+        """
+        old = self.get(product)
+        return self.met - (old is not None and self.meets(product, old[0])) + self.meets(product, amount)
+
+    def buy_if(self, product, amount, price):
+        """Output:
+            (met, asset_cost) (tuple): goal count and total asset cost after buying amount of product at price,
+                                       as update_inv_gold would leave them.
+        """
+        old_amount, old_cost = self.get(product, no_stock())
+        return self.met_if(product, old_amount + amount), self.total_cost + amount * price
+
+    def sell_if(self, product, amount):
+        """Output:
+            (met, asset_cost) (tuple): goal count and total asset cost after selling amount of product,
+                                       as update_inv_gold would leave them.
+        """
+        old_amount, old_cost = self.get(product, no_stock())
+        single_cost = old_cost / old_amount
+        new_cost = max(old_cost - amount * single_cost, 0)
+        return self.met_if(product, old_amount - amount), self.total_cost - old_cost + new_cost
+
 
 class Player(BasePlayer):
     def __init__(self):
@@ -123,7 +391,7 @@ class Player(BasePlayer):
         self.max_turn = 300                           # maximum turns in a game
         self.researched = set()                       # researched markets:           [market1, market2..]
         self.market_prices = {}                       # prices from self/players:     {market:{product:[price, amount]}}
-        self.inventory = defaultdict(lambda: (0, 0))  # record items in inventory:    {product:(amount, asset_cost)}
+        self.inventory = Ledger()                     # record items in inventory:    {product:(amount, asset_cost)}
         self.gold = 0                                 # gold:                            0,1,..*
         self.goal_achieved = False                    # indicates whether goal achieved: True/False
         self.visited_node = defaultdict(int)          # location visit counts:           {location: times_visited}
@@ -135,9 +403,21 @@ class Player(BasePlayer):
         self.interest = 1.1                           # interest rate for overdrawn gold
         self.blacklist = defaultdict(set)             # set of markets with no amount for each product
         self.price_stats = {}                         # stats of market prices        {product: (price var, 75th, 25th)}
+        self.stats = PriceStats()                     # prices of the white markets price_stats is made from
+        self.knowledge = MarketKnowledge()            # market_prices as NumPy matrices
+        self.knowledge_from = None                    # the market_prices dict knowledge was synced from
+        self.new_prices = []                          # markets saved since knowledge was last synced, in order
+        self.white_bg = frozenset()                   # black and grey markets nearest_whites is for
+        self.nearest_whites = {}                      # nearest white market to a market: {market: white market}
         self.profit_order = []                        # A list of products in order to sell
+        self.route_ids = np.zeros(0, dtype=np.intp)   # map node ids of the knowledge rows, for plan_route
         self.final_turns = 0                          # The count of turns used at the end of the game
 
+    def set_goal(self, goal):
+        """Set the goal, and count the products in the inventory that meet it from now on."""
+        super().set_goal(goal)
+        self.inventory.bind(goal)
+
     def take_turn(self, location, prices, info, bm, gm):
         """Player takes a turn with (hopefully) informed choices.
         Player can take any one of the following turns:
@@ -202,6 +482,7 @@ class Player(BasePlayer):
         """
         if prices:
             self.market_prices[self.loc] = prices
+            self.new_prices.append(self.loc)
 
     def collect_rumours(self, info):
         """Collect intel from other players at the same location, then store it in self.market_prices.
@@ -216,6 +497,21 @@ class Player(BasePlayer):
             for market, information in info.items():
                 if not self.market_prices.get(market):
                     self.market_prices[market] = {k: (v, None) for k, v in information.items()}
+                    self.new_prices.append(market)
+
+    def sync_knowledge(self):
+        """Bring self.knowledge up to date with self.market_prices. Only the markets saved since
+        the last sync are looked at, unless market_prices has been replaced by another dict.
+        Output:
+            knowledge (MarketKnowledge): self.knowledge
+        """
+        if self.market_prices is self.knowledge_from:
+            self.knowledge.sync(self.market_prices, self.turn, self.new_prices)
+        else:
+            self.knowledge.sync(self.market_prices, self.turn)
+            self.knowledge_from = self.market_prices
+        self.new_prices = []
+        return self.knowledge
 
     def get_strategy(self, prices, bm, gm):
         """Returns a tuple that dictates the player's current strategy based on other strategy functions
@@ -247,6 +543,9 @@ class Player(BasePlayer):
                 self.gold -= self.black_penalty
             if self.target_loc in bg_set or self.target_loc is None:
                 self.target_loc = self.nearest_white(self.loc, bg_set)
+            # If there is no white market left, stay put
+            if self.target_loc == self.loc:
+                return Command.PASS, None
             return Command.MOVE_TO, self.get_next_step(self.target_loc)
 
         # Next highest priority:
@@ -278,6 +577,13 @@ class Player(BasePlayer):
         # Once the goal is achieved, the player will choose to maximise profits again
         buy, sell = self.buy_sell(prices)
         if self.turn < self.max_turn * 2 / 3:
+            # Trade along the most profitable route per turn of all the known markets.
+            # Without one, fall back to the nearest market the statistics favour.
+            route = self.plan_route(bg_set)
+            if route:
+                cmd = self.follow_route(route, prices)
+                if cmd:
+                    return cmd
             target_market = self.search_market(bg_set, risk=0)
             return self.profit_max(target_market, buy, sell, prices, bg_set)
         elif not self.goal_achieved:
@@ -335,11 +641,17 @@ class Player(BasePlayer):
     def get_path_to(self, target_location):
         """Finds the fastest path by employing a breadth-first search algorithm.
         Since all edges are currently unweighted, only a simplified breadth-first
-        while storing each previous node is required
+        while storing each previous node is required.
+        The map's hop tables give the path directly; the search below is only used for maps without them.
         """
         # Set the starting location as the player's current location
         start = self.loc
 
+        try:
+            return self.map.path(start, target_location)
+        except (AttributeError, KeyError, ValueError):
+            pass
+
         # Collect all the nodes in the given map
         nodes = self.map.get_node_names()
 
@@ -429,37 +741,33 @@ class Player(BasePlayer):
 
         return min_node, distance_dict
 
-    def nearest_white(self, target_market, bg_set, assessed=set()):
+    def nearest_white(self, target_market, bg_set):
         """Returns the market location closest to the target market that is white
            If the target market is white, returns the target.
+           Results are kept until bg_set changes, so repeated calls in a turn are free.
         Args:
             bg_set (set): Set of black and grey markets
             target_market (str): Target market from search. 
         
         Output:
-             (str): return the nearest white market from the current location
+             (str): return the nearest white market to the target market, ties going to the first
+                    by name. If no white market can be reached, returns the target market.
         """
         # return the target market if it is a white market
         if target_market not in bg_set:
             return target_market
 
-        # Get the neighbours of the target market that have not been assessed
-        # If this set less the black/grey market set is not empty,
-        # Return a random target white market
-        neighbours = self.map.get_neighbours(target_market)
-        neighbour_set = neighbours - assessed
-        white_set = neighbour_set - bg_set
-        if white_set:
-            return random.choice(list(white_set))
-
-        # Otherwise, the assessed locations and all of the neighbours are black
-        # The assessed should be updated to include all neighbours and a random
-        # next_market chosen from any of the neighbour set
-        else:
-            assessed.add(target_market)
-            assessed = assessed.union(neighbour_set)
-            next_market = random.choice(list(neighbours))
-            return self.nearest_white(next_market, bg_set, assessed)
+        # The black and grey markets only change between turns, forget the old results when they do
+        if bg_set != self.white_bg:
+            self.white_bg = frozenset(bg_set)
+            self.nearest_whites = {}
+
+        # Search outwards from the target market for the closest white market
+        if target_market not in self.nearest_whites:
+            white_set = set(self.map.get_node_names()) - bg_set
+            nearest = self.nearest_market(target_market, white_set)
+            self.nearest_whites[target_market] = target_market if nearest is None else nearest
+        return self.nearest_whites[target_market]
 
     def cut_losses(self, prices):
         """Panic button function for the player to decide what part of his inventory to sell if goal is negative.
@@ -480,16 +788,14 @@ class Player(BasePlayer):
             final_assets = -math.inf
             to_sell = None
             sell_num = 0
-            for product, info in self.inventory.items():
+            for product, info in sorted(self.inventory.items()):
                 # Calculate the number of the currently assessed product required to
                 # offset the negative gold cost
                 tmp_num = -int(self.gold // prices[product][0])
                 # Only consider the items in inventory that can fully amortise the negative gold
                 if info[0] >= tmp_num:
-                    # Assess the situation by creating a faux inventory for analysis
-                    tmp_inv = copy.deepcopy(self.inventory)
-                    tmp_inv, _ = self.update_inv_gold(prices, tmp_inv, product, tmp_num, gold=0, action=1)
-                    tmp_assets = sum([cost for amt, cost in tmp_inv.values()])
+                    # Assess the assets left after the sale from the inventory ledger
+                    _, tmp_assets = self.inventory.sell_if(product, tmp_num)
                     if tmp_assets >= final_assets:
                         final_assets = tmp_assets
                         to_sell = product
@@ -498,7 +804,7 @@ class Player(BasePlayer):
         # If the player does not have enough in his inventory, he will decide to dump the most expensive of
         # any one of the player's inventory.
         if to_sell is None:
-            to_sell = max(self.inventory, key=lambda x: self.inventory[x][0] * prices[x][0])
+            to_sell = max(sorted(self.inventory), key=lambda x: self.inventory[x][0] * prices[x][0])
             sell_num = self.inventory[to_sell][0]
 
         # Return the command tuple for the stategy output
@@ -511,7 +817,7 @@ class Player(BasePlayer):
         Output:
             (int): The number of items in the inventory of that product that is greater than the goal amount.
             """
-        return max(int(self.inventory[product][0] - self.goal[product]), 0)
+        return max(int(self.inventory[product][0] - self.goal.get(product, 0)), 0)
 
     def any_excess(self, sell_set):
         """Function to determine if any excess stock in sell set exists in player inventory.
@@ -522,7 +828,7 @@ class Player(BasePlayer):
         Output:
             product (str): the first product that is in excess
         """
-        for product in sell_set:
+        for product in sorted(sell_set):
             if self.excess_stock(product):
                 return product
         return None
@@ -593,19 +899,19 @@ class Player(BasePlayer):
         researched = self.researched
         # First check if there are any available markets that have not been researched
         # If there are any available markets, choose a random one to return
-        avail = list(markets - researched - bg_set - ignore_set)
+        avail = sorted(markets - researched - bg_set - ignore_set)
         if avail:
             return random.choice(avail)
         else:
             # Check if there are any markets that are researched to return
-            avail = list(markets - bg_set - ignore_set)
+            avail = sorted(markets - bg_set - ignore_set)
             if avail:
                 return random.choice(avail)
 
             # The only case where the above set is empty is if the player is in the ignore_set
             # In which case, just return a random location that is not in the black and grey set
             else:
-                return random.choice(list(markets - bg_set))
+                return random.choice(sorted(markets - bg_set))
 
     def update_stats(self, bg_set):
         """Function to update player knowledge on statistics of the market the only useful 
@@ -616,22 +922,18 @@ class Player(BasePlayer):
             bg_set (set): Set of black and grey markets
         Output: None
         """
-        product_price = defaultdict(list)
-
         # The target region for the risk averse player is the region that does not include any
         # black or grey markets. For this reason, the player will only update the statistics within
-        # this region.
-        target_region = set(self.market_prices.keys()) - bg_set
-        for market in target_region:
-            for product in self.market_prices[market].keys():
-                product_price[product].append(self.market_prices[market][product][0])
+        # this region. Only markets that are new, have new prices, or have left the region change the stats.
+        target_region = self.market_prices.keys() - bg_set
+        self.stats.update(self.market_prices, target_region)
 
         # Store the statistical information of the products
         # price stats are: {product: (price variance, 75th percentile, 25th percentile)}
-        self.price_stats = {product: (np.var(product_price[product]),
-                                      np.percentile(product_price[product], 75),
-                                      np.percentile(product_price[product], 25))
-                            for product in product_price.keys()}
+        self.price_stats = {product: (self.stats.var(product),
+                                      self.stats.percentile(product, 75),
+                                      self.stats.percentile(product, 25))
+                            for product in self.stats.products()}
 
         # The player will then create a list in order of their variances to determine which item
         # will sell for the greatest profit. This is ordered in descending order to determine which
@@ -736,35 +1038,161 @@ class Player(BasePlayer):
         # The player's target region is still one without black or grey markets, since the purchase
         # function will empty our gold coffers completely, and we must avoid going into the
         # negative.
-        target_region = set(self.market_prices.keys()) - bg_set
+        # All known markets are compared at once, as rows of the knowledge matrices.
+        knowledge = self.sync_knowledge()
+        target_region = ~knowledge.mask(bg_set)
         possible_targets = set()
         if product_targets:
-            for market in target_region:
-                for product in product_targets:
-                    market_price = self.market_prices[market][product][0]
-                    if action == 0:
-                        # get the 25th percentile price of this product to buy
-                        curr_price = self.price_stats[product][2]
-
-                        # check if market is not blacklisted for this product
-                        if market not in self.blacklist[product]:
-                            if market_price < curr_price:
-                                possible_targets.add(market)
-                    else:
-                        # get the 75th percentile price of this product to sell
-                        curr_price = self.price_stats[product][1]
-                        if market_price > curr_price:
-                            possible_targets.add(market)
-
-        # calculate the distances to these markets
-        dist_to_target = {market: len(self.get_path_to(market))
-                          for market in possible_targets if market}
-        if dist_to_target:
-            target_market = min(dist_to_target, key=dist_to_target.get)
-        else:
-            target_market = None
+            market_price = knowledge.prices_of(product_targets)
+            if action == 0:
+                # get the 25th percentile price of each product to buy
+                curr_price = np.array([self.price_stats[product][2] for product in product_targets])
+
+                # check if market is not blacklisted for this product
+                allowed = np.column_stack([~knowledge.mask(self.blacklist[product]) for product in product_targets])
+                targets = (market_price < curr_price) & allowed
+            else:
+                # get the 75th percentile price of each product to sell
+                curr_price = np.array([self.price_stats[product][1] for product in product_targets])
+                targets = market_price > curr_price
+            rows = np.flatnonzero(target_region & targets.any(axis=1))
+            possible_targets = {knowledge.markets[row] for row in rows}
+
+        # the closest of these markets
+        return self.nearest_market(self.loc, possible_targets)
+
+    def nearest_market(self, sources, candidates):
+        """Breadth-first search outwards from the sources, stopping at the first layer that
+        contains a candidate market.
+        Args:
+            sources (str or iterable): market, or markets, to search from.
+            candidates (set): markets being looked for.
+        Output:
+            market (str): the candidate with the fewest moves from any source. Ties go to the
+                          first market by name. None if no candidate can be reached.
+        """
+        if isinstance(sources, str):
+            sources = [sources]
+        visited = set(sources)
+        layer = list(visited)
+        while layer:
+            found = [market for market in layer if market in candidates]
+            if found:
+                return min(found)
+
+            # Collect the unvisited neighbours of this layer as the next layer
+            next_layer = []
+            for market in layer:
+                for n in self.map.get_neighbours(market):
+                    if n not in visited:
+                        visited.add(n)
+                        next_layer.append(n)
+            layer = next_layer
+        return None
+
+    def plan_route(self, bg_set):
+        """Score every (buy market, sell market, product) trade between the known white markets by
+        its profit per turn, and return the next step of the best one.
+        A trade takes the moves to the buy market, a turn to buy, the moves on to the sell market and
+        a turn to sell, plus a turn to research each market that has not been seen. The amount bought
+        is what the player can afford of the known stock; rumoured markets are assumed to hold the
+        average known stock of the product. Stock the player is carrying beyond the goal is sold before
+        buying again, if it can be sold at a profit.
+        Args:
+            bg_set (set): Set of black and grey markets
+        Output:
+            route (tup): (market, product, Command.BUY or Command.SELL), the trade to make next and where.
+                         None if no trade makes a profit before the end game.
+        """
+        try:
+            tables = self.map.hop_tables()
+        except (AttributeError, ValueError):
+            return None
+        knowledge = self.sync_knowledge()
+        n = len(knowledge.markets)
+        if not n or self.loc not in tables['index']:
+            return None
 
-        return target_market
+        # Hop distances from here and between the known markets, rows in the order of the knowledge
+        ids = self.route_ids
+        if len(ids) < n:
+            index = tables['index']
+            ids = np.append(ids, [index[market] for market in knowledge.markets[len(ids):]]).astype(np.intp)
+            self.route_ids = ids
+        dist = tables['dist']
+        here = dist[tables['index'][self.loc], ids].astype(float)
+        between = dist[np.ix_(ids, ids)].astype(float)
+        here[here == UNREACHABLE] = np.inf
+        between[between == UNREACHABLE] = np.inf
+
+        research = (knowledge.source[:n] != MarketKnowledge.SOURCE_SEEN).astype(float)
+        white = ~knowledge.mask(bg_set)
+        price = knowledge.price[:n]
+        turns_left = self.max_turn - self.final_turns - self.turn
+
+        # Sell the stock being carried beyond the goal where it makes the most profit per turn over
+        # its share of the cost. Stock that can't be sold at a profit is kept, and a purchase planned.
+        held = [col for col, product in enumerate(knowledge.products) if self.excess_stock(product)]
+        if held:
+            amount = np.array([self.excess_stock(knowledge.products[col]) for col in held], dtype=float)
+            cost = np.array([self.inventory[knowledge.products[col]][1] * self.excess_stock(knowledge.products[col])
+                             / self.inventory[knowledge.products[col]][0] for col in held])
+            turns = here + research + 1
+            gain = price[:, held] * amount - cost
+            valid = white[:, None] & (turns <= turns_left)[:, None] & (gain > 0)
+            score = np.where(valid, gain / turns[:, None], 0)
+            if score.max() > 0:
+                row, col = np.unravel_index(score.argmax(), score.shape)
+                return knowledge.markets[row], knowledge.products[held[col]], Command.SELL
+
+        if self.gold <= 0:
+            return None
+
+        # Stock to buy: the known amount, the average known amount for rumours, and none where
+        # the product has run out.
+        stock = knowledge.amount[:n]
+        known = ~np.isnan(stock)
+        count = known.sum(axis=0)
+        average = np.where(count > 0, np.nansum(stock, axis=0) / np.maximum(count, 1), 0)
+        stock = np.where(known, stock, average)
+        for col, product in enumerate(knowledge.products):
+            stock[knowledge.mask(self.blacklist[product]), col] = 0
+        quantity = np.minimum(stock, self.gold // price)
+
+        # gain[b, s, p]: buying product p at market b and selling it at market s
+        gain = (price[None, :, :] - price[:, None, :]) * quantity[:, None, :]
+        turns = (here + research)[:, None] + between + research[None, :] + 2
+        valid = (white[:, None] & white[None, :] & (turns <= turns_left))[:, :, None] & (gain > 0)
+        score = np.where(valid, gain / turns[:, :, None], 0)
+        if score.max() <= 0:
+            return None
+        buy, _, col = np.unravel_index(score.argmax(), score.shape)
+        return knowledge.markets[buy], knowledge.products[col], Command.BUY
+
+    def follow_route(self, route, prices):
+        """Take the next step of a route from plan_route: move to its market, research it, then trade.
+        Args:
+            route (tup): (market, product, Command.BUY or Command.SELL)
+            prices (dict): The prices of this market
+        Output:
+            cmd (tup): The tuple of Command.CMD, data. None if the trade can't be made here after all.
+        """
+        market, product, cmd = route
+        self.target_loc = market
+        if self.loc != market:
+            return Command.MOVE_TO, self.get_next_step(market)
+        if not prices:
+            return Command.RESEARCH, None
+        if product not in prices:
+            return None
+
+        if cmd == Command.BUY:
+            amount = self.afford_amount(prices, product)
+        else:
+            amount = self.excess_stock(product)
+        if amount > 0:
+            return cmd, (product, amount)
+        return None
 
     def profit_max(self, target_market, buy, sell, prices, bg_set, risk=0):
         """Switch function for the player to maximise profit instead of following the goal.
@@ -956,25 +1384,22 @@ class Player(BasePlayer):
         max_score = self.gold
         buy_amt = 0
         to_buy = None
+        self.inventory.bind(self.goal)
 
         # find the best item to buy
         for product in market_info.keys():
 
-            # initialize dummy variables used to record after purchase inventory and gold to compute score
-            tmp_inventory = copy.deepcopy(self.inventory)
-            tmp_gold = self.gold
-
             # if product is what we need
             if product in self.goal.keys() and self.inventory[product][0] < self.goal[product]:
                 tmp_amt = min(int(self.afford_amount(market_info, product)),
                               self.goal[product] - self.inventory[product][0])
 
-                # update dummy variables to reflect after purchase inventory and gold level
-                tmp_inventory, tmp_gold = self.update_inv_gold(market_info, tmp_inventory, product, tmp_amt,
-                                                               tmp_gold, action=0)
+                # score after the purchase, from the inventory ledger without changing it
+                tmp_met, _ = self.inventory.buy_if(product, tmp_amt, market_info[product][0])
+                tmp_gold = self.gold - tmp_amt * market_info[product][0]
+                tmp_score = self.bonus * tmp_met + tmp_gold
 
-                # compute score and update best item to buy
-                tmp_score = self.compute_score(tmp_inventory, tmp_gold, self.goal)
+                # update best item to buy
                 if tmp_score > max_score:
                     to_buy = product
                     buy_amt = int(tmp_amt)
@@ -1008,6 +1433,10 @@ class Player(BasePlayer):
                     How many gold the player has currently.
         Output: score (int)
         """
+        # A ledger already counts the goals met
+        if isinstance(inventory, Ledger) and inventory.goal is goal:
+            return self.bonus * inventory.met + gold
+
         score = 0
         # score for hitting target
         for item in inventory.keys():
@@ -1084,7 +1513,7 @@ class Player(BasePlayer):
 import unittest
 import string
 from itertools import cycle
-from Map import Map
+from Map import Map, HOP_TABLE_MAX_NODES
 
 
 # Define the test suite for all test cases.
@@ -1094,6 +1523,9 @@ def suite():
 
     # Map testing
     test_suite.addTest(MapTestCase('test_central'))
+    test_suite.addTest(MapTestCase('test_nearest_market'))
+    test_suite.addTest(MapTestCase('test_nearest_white'))
+    test_suite.addTest(MapTestCase('test_big_map'))
     # test_suite.addTest(MapTestCase('test_search_market'))
 
     # Movement testing
@@ -1104,11 +1536,17 @@ def suite():
     test_suite.addTest(KnowledgeTestCase('test_check_goal'))
     test_suite.addTest(KnowledgeTestCase('test_rumours'))
     test_suite.addTest(KnowledgeTestCase('test_prices'))
+    test_suite.addTest(KnowledgeTestCase('test_price_stats'))
+    test_suite.addTest(KnowledgeTestCase('test_ledger'))
+    test_suite.addTest(KnowledgeTestCase('test_knowledge'))
     test_suite.addTest(KnowledgeTestCase('test_buy_sell'))
 
     # Strategy testing
     test_suite.addTest(StrategyTestCase('test_first_turn'))
     test_suite.addTest(StrategyTestCase('test_purchase'))
+    test_suite.addTest(StrategyTestCase('test_plan_route'))
+    test_suite.addTest(StrategyTestCase('test_route_keeps_goal'))
+    test_suite.addTest(StrategyTestCase('test_route_after_loss'))
 
     return test_suite
 
@@ -1122,6 +1560,47 @@ class MapTestCase(unittest.TestCase):
         p.map = test_map()
         self.assertEqual(p.central_market()[0], "V")
 
+    # Tests if the nearest market is the one with the shortest path, ties going to the first by name.
+    def test_nearest_market(self):
+        p = Player()
+        p.map = test_map()
+        p.loc = "A"
+        neighbours = p.map.get_neighbours("A")
+        self.assertEqual(p.nearest_market("A", {"A", "V"}), "A")
+        self.assertEqual(p.nearest_market("A", {"V"} | neighbours), min(neighbours))
+        self.assertEqual(len(p.get_path_to(p.nearest_market("A", {"V", "Q"}))),
+                         min(len(p.get_path_to("V")), len(p.get_path_to("Q"))))
+        self.assertEqual(p.nearest_market(["V", "A"], {"V"}), "V")
+        self.assertIsNone(p.nearest_market("A", set()))
+
+    # Tests if the nearest white market is found from inside a black/grey region, and that
+    # nothing is carried over between calls.
+    def test_nearest_white(self):
+        p = Player()
+        p.map = test_map()
+        neighbours = p.map.get_neighbours("A")
+        self.assertEqual(p.nearest_white("A", set()), "A")
+        self.assertEqual(p.nearest_white("A", {"A"}), min(neighbours))
+        bg_set = {"A"} | neighbours
+        white = p.nearest_white("A", bg_set)
+        self.assertNotIn(white, bg_set)
+        self.assertEqual(p.map.distance("A", white), 2)
+        self.assertEqual(p.nearest_white("A", {"A"}), min(neighbours))
+        all_nodes = set(p.map.get_node_names())
+        self.assertEqual(p.nearest_white("A", all_nodes), "A")
+
+    # Maps too big for hop tables are searched instead
+    def test_big_map(self):
+        p = Player()
+        p.map = Map(["n{}".format(i) for i in range(HOP_TABLE_MAX_NODES + 1)], 2000, 1000, 2, 3, seed=5)
+        p.loc = "n0"
+        target = "n{}".format(HOP_TABLE_MAX_NODES)
+        path = p.get_path_to(target)
+        self.assertEqual(path[0], "n0")
+        self.assertEqual(path[-1], target)
+        self.assertTrue(all(p.map.is_road(a, b) for a, b in zip(path, list(path)[1:])))
+        self.assertIsNone(p.plan_route(set()))
+
     # Superceded test
     # def test_search_market(self):
     #     p = Player()
@@ -1224,6 +1703,74 @@ class KnowledgeTestCase(unittest.TestCase):
         self.assertTrue(p.market_prices)
         self.assertEqual(p.market_prices["A"]["Food"], [90, 100])
 
+    def test_price_stats(self):
+        # Tests if the statistics kept as markets come and go match those computed from scratch
+        p = Player()
+        p.market_prices = {'A': {'Food': (95, 700), 'Social': (49, 1400)},
+                           'B': {'Food': (80, 700), 'Social': (46, 1400)},
+                           'C': {'Food': (113, 700)},
+                           'D': {'Food': (61, None)}}
+        for bg_set in [set(), {'B'}, {'B', 'C'}, set()]:
+            p.update_stats(bg_set)
+            food = [info['Food'][0] for market, info in p.market_prices.items() if market not in bg_set]
+            self.assertAlmostEqual(p.price_stats['Food'][0], np.var(food))
+            self.assertEqual(p.price_stats['Food'][1], np.percentile(food, 75))
+            self.assertEqual(p.price_stats['Food'][2], np.percentile(food, 25))
+        p.market_prices['A'] = {'Food': (20, 700)}
+        p.update_stats({'C', 'D'})
+        self.assertEqual(set(p.price_stats), {'Food', 'Social'})
+        self.assertEqual(p.price_stats['Food'][1], np.percentile([20, 80], 75))
+        self.assertEqual(p.price_stats['Social'][0], 0)
+
+    def test_ledger(self):
+        # Tests if the inventory ledger's counts and what-if results match the full computation
+        p = Player()
+        p.set_goal({'Food': 10, 'Social': 5, 'Hardware': 0})
+        p.inventory['Food'] = (4, 40)
+        p.inventory['Social'] = (6, 60)
+        self.assertEqual(p.compute_score(p.inventory, 0, p.goal), p.bonus)
+        self.assertEqual(p.inventory['Hardware'], (0, 0))
+        self.assertEqual(p.compute_score(p.inventory, 0, p.goal), 2 * p.bonus)
+        self.assertEqual(p.inventory.buy_if('Food', 6, 20), (3, 220))
+        self.assertEqual(p.inventory.sell_if('Social', 3), (1, 70))
+        p.inventory, _ = p.update_inv_gold({'Social': (30, 1)}, p.inventory, 'Social', 3, 0, action=1)
+        self.assertEqual((p.inventory.met, p.inventory.total_cost), (1, 70))
+        self.assertEqual(p.compute_score(p.inventory, 5, p.goal), p.compute_score(dict(p.inventory), 5, p.goal))
+
+    def test_knowledge(self):
+        # Tests if the knowledge matrices follow market_prices, including rumours and replaced prices
+        p = Player()
+        p.market_prices = {'A': {'Food': (95, 700), 'Social': (49, 1400)},
+                           'B': {'Food': (61, None)}}
+        p.knowledge.sync(p.market_prices, 1)
+        self.assertEqual(p.knowledge.prices_of(['Food']).ravel().tolist(), [95, 61])
+        self.assertTrue(np.isnan(p.knowledge.prices_of(['Social'])[1, 0]))
+        self.assertTrue(np.isnan(p.knowledge.prices_of(['Hardware'])).all())
+        self.assertEqual(p.knowledge.source[:2].tolist(), [MarketKnowledge.SOURCE_SEEN, MarketKnowledge.SOURCE_RUMOUR])
+        p.market_prices['B'] = {'Food': (70, 700)}
+        p.knowledge.sync(p.market_prices, 2)
+        self.assertEqual(p.knowledge.prices_of(['Food']).ravel().tolist(), [95, 70])
+        self.assertEqual(p.knowledge.observed[:2].tolist(), [1, 2])
+        self.assertEqual(p.knowledge.mask({'B', 'C'}).tolist(), [False, True])
+
+        # Only the markets saved since the last sync are looked at
+        p.sync_knowledge()
+        p.loc = 'C'
+        p.save_market_prices({'Hardware': (500, 35)})
+        p.collect_rumours({'D': {'Food': 88}, 'A': {'Food': 1}})
+        self.assertEqual(p.new_prices, ['C', 'D'])
+        prices = p.sync_knowledge().prices_of(['Food', 'Hardware'])
+        self.assertEqual(prices[2, 1], 500)
+        self.assertEqual(prices[3, 0], 88)
+        self.assertEqual(prices[0, 0], 95)
+        self.assertFalse(p.new_prices)
+
+        # No products known yet
+        self.assertEqual(MarketKnowledge().prices_of(['Food']).shape, (0, 1))
+        k = MarketKnowledge()
+        k.add_market('A')
+        self.assertTrue(np.isnan(k.prices_of(['Food', 'Social'])).all())
+
     def test_buy_sell(self):
         p1 = Player()
         gold = 1000.0
@@ -1314,6 +1861,58 @@ class StrategyTestCase(unittest.TestCase):
         self.assertEqual(prod, 'Food')
         self.assertEqual(amt, 5)
 
+    # Test the trade route from all the known markets
+    def test_plan_route(self):
+        p = Player()
+        p.map = test_map()
+        p.loc = 'A'
+        p.turn = 10
+        p.set_goal({'Food': 10})
+        p.set_gold(3000.0)
+        p.market_prices = {'A': {'Food': (100, 700), 'Electronics': (300, 210)},
+                           'B': {'Food': (120, 700), 'Electronics': (900, 210)},
+                           'C': {'Food': (50, None)}}
+
+        # 10 Electronics bought at A sell for 6000 more at B, more than any Food trade
+        self.assertEqual(p.plan_route(set()), ('A', 'Electronics', Command.BUY))
+        cmd, data = p.follow_route(('A', 'Electronics', Command.BUY), p.market_prices['A'])
+        self.assertEqual((cmd, data), (Command.BUY, ('Electronics', 10)))
+
+        # Carried stock is sold first, and not at a loss
+        p.inventory['Electronics'] = (10, 3000)
+        self.assertEqual(p.plan_route(set()), ('B', 'Electronics', Command.SELL))
+        # Without B to sell at, the Electronics are kept and Food bought where it is cheapest
+        self.assertEqual(p.plan_route({'B'}), ('C', 'Food', Command.BUY))
+
+    def route_player(self):
+        p = Player()
+        p.map = test_map()
+        p.loc = 'A'
+        p.turn = 10
+        p.set_goal({'Food': 10})
+        p.set_gold(3000.0)
+        p.market_prices = {'A': {'Food': (100, 700), 'Electronics': (300, 210)},
+                           'B': {'Food': (120, 700), 'Electronics': (900, 210)}}
+        return p
+
+    # Test that the stock the goal needs is not sold on a route
+    def test_route_keeps_goal(self):
+        p = self.route_player()
+        p.inventory['Food'] = (10, 500)
+        self.assertEqual(p.plan_route(set()), ('A', 'Electronics', Command.BUY))
+
+        # Only the 5 Food beyond the goal is sold, here rather than walking to B
+        p.inventory['Food'] = (15, 750)
+        self.assertEqual(p.plan_route(set()), ('A', 'Food', Command.SELL))
+        cmd, data = p.follow_route(('A', 'Food', Command.SELL), p.market_prices['A'])
+        self.assertEqual((cmd, data), (Command.SELL, ('Food', 5)))
+
+    # Test that stock which can't be sold at a profit doesn't stop the player buying
+    def test_route_after_loss(self):
+        p = self.route_player()
+        p.inventory['Electronics'] = (10, 20000)
+        self.assertEqual(p.plan_route(set()), ('A', 'Electronics', Command.BUY))
+
 
 # This function helps output the map for testing.
 # Allows the size and seed to be mutable.
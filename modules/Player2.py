@@ -105,13 +105,175 @@ Items Authored (Work Breakdown):
 
 import Command
 from BasePlayer import BasePlayer
-from collections import defaultdict, deque
+from collections import defaultdict, deque, OrderedDict
 import random
 import math
 import copy
 import numpy as np
 import heapq
 
+BG_COST = 99            # cost of moving onto a black/grey market when path finding
+PATH_CACHE_SIZE = 64    # number of targets PathCache keeps shortest path trees for
+
+
+def no_stock():
+    """Default inventory entry (amount, asset_cost). A named function so that players can be pickled."""
+    return 0, 0
+
+
+class PathCache:
+    """Shortest paths to recently used targets, kept up to date as markets turn black/grey.
+
+    Moving onto a black/grey market costs BG_COST and onto any other market 1, the same costs
+    as the uniform cost search used before. For every target a shortest path tree towards it is
+    kept: dist[v] is the cost from v to the target and parent[v] the next step from v.
+    The bg set only grows during a game, which can only make paths more expensive, so when a
+    market turns black/grey only the markets whose path went through it are searched again.
+    """
+    def __init__(self, game_map, size=None):
+        """
+        Args:
+            game_map (Map): the map.
+            size (int): number of targets to keep trees for, least recently used are dropped.
+        """
+        # Ids and neighbours are made here from get_node_names/get_neighbours, which every version
+        # of Map has, in the same order as Map.node_tables: neighbours in increasing id order.
+        self.game_map = game_map
+        self.names = tuple(game_map.get_node_names())
+        self.ids = {node: i for i, node in enumerate(self.names)}
+        self.neighbours = [sorted(self.ids[n] for n in game_map.get_neighbours(node) if n in self.ids)
+                           for node in self.names]
+        self.size = PATH_CACHE_SIZE if size is None else size
+        self.reset()
+
+    def reset(self):
+        """Forget the bg set and every tree."""
+        self.cost = [1] * len(self.names)     # cost of moving onto each market
+        self.bg = set()                       # black/grey markets the costs are for
+        self.changes = []                     # market ids in the order their cost went up
+        self.trees = OrderedDict()            # {target id: [dist, parent, number of changes applied]}
+
+    def update(self, bg_set):
+        """Set the current black/grey markets.
+        Args:
+            bg_set (set): set of market names that are black/grey.
+        """
+        if not self.bg <= bg_set:
+            # Markets only ever get added during a game, start again if one was removed.
+            self.reset()
+        for market in bg_set - self.bg:
+            if market in self.ids:
+                i = self.ids[market]
+                self.cost[i] = BG_COST
+                self.changes.append(i)
+        self.bg = set(bg_set)
+
+    def path(self, source, target):
+        """Find the cheapest path from source to target.
+        Args:
+            source (str): starting market.
+            target (str): destination market.
+        Output:
+            path (deque): markets from source to target, both included, or None if target can't be reached.
+        """
+        if source not in self.ids or target not in self.ids:
+            return None
+        t = self.ids[target]
+        dist, parent, _ = self.tree(t)
+        i = self.ids[source]
+        if dist[i] == math.inf:
+            return None
+        path = deque([source])
+        while i != t:
+            i = parent[i]
+            path.append(self.names[i])
+        return path
+
+    def tree(self, target):
+        """Output:
+            tree (list): [dist, parent, changes applied] for the target id, made or repaired as required.
+        """
+        tree = self.trees.get(target)
+        if tree is None:
+            dist = [math.inf] * len(self.names)
+            parent = [-1] * len(self.names)
+            dist[target] = 0
+            parent[target] = target
+            self.search(target, dist, parent, [(0, target)])
+            tree = [dist, parent, len(self.changes)]
+            self.trees[target] = tree
+            if len(self.trees) > self.size:
+                self.trees.popitem(last=False)
+        else:
+            self.trees.move_to_end(target)
+            if tree[2] < len(self.changes):
+                self.repair(target, tree, self.changes[tree[2]:])
+                tree[2] = len(self.changes)
+        return tree
+
+    def search(self, target, dist, parent, heap):
+        """Dijkstra from the markets in heap outwards, away from the target.
+        The target is on every path, so its own cost is left out.
+        """
+        cost = self.cost
+        neighbours = self.neighbours
+        heapq.heapify(heap)
+        while heap:
+            d, i = heapq.heappop(heap)
+            if d > dist[i]:
+                continue
+            if i != target:
+                d += cost[i]
+            for n in neighbours[i]:
+                if d < dist[n]:
+                    dist[n] = d
+                    parent[n] = i
+                    heapq.heappush(heap, (d, n))
+
+    def repair(self, target, tree, changed):
+        """Update a tree after the markets in changed became more expensive.
+        Only markets whose path went through a changed market can get more expensive, the
+        others keep their path. The affected markets are searched again from their neighbours.
+        """
+        dist, parent, _ = tree
+        children = [[] for _ in self.names]
+        for i, p in enumerate(parent):
+            if p >= 0 and p != i:
+                children[p].append(i)
+
+        affected = []
+        stack = [c for i in set(changed) if i != target for c in children[i]]
+        while stack:
+            i = stack.pop()
+            affected.append(i)
+            stack += children[i]
+        if not affected:
+            return
+
+        if 2 * len(affected) > len(dist):
+            # Most of the tree is affected, searching again from the target is quicker.
+            dist[:] = [math.inf] * len(dist)
+            parent[:] = [-1] * len(parent)
+            dist[target] = 0
+            parent[target] = target
+            self.search(target, dist, parent, [(0, target)])
+            return
+
+        for i in affected:
+            dist[i] = math.inf
+            parent[i] = -1
+
+        cost = self.cost
+        heap = []
+        for i in affected:
+            for n in self.neighbours[i]:
+                d = dist[n] + (cost[n] if n != target else 0)
+                if d < dist[i]:
+                    dist[i] = d
+                    parent[i] = n
+            if dist[i] < math.inf:
+                heap.append((dist[i], i))
+        self.search(target, dist, parent, heap)
 
 class Player(BasePlayer):
     def __init__(self):
@@ -124,7 +286,7 @@ class Player(BasePlayer):
         self.max_turn = 300                           # maximum turns in a game
         self.researched = set()                       # researched markets:           [market1, market2..]
         self.market_prices = {}                       # prices from self/players:     {market:{product:[price, amount]}}
-        self.inventory = defaultdict(lambda: (0, 0))  # record items in inventory:    {product:(amount, asset_cost)}
+        self.inventory = defaultdict(no_stock)        # record items in inventory:    {product:(amount, asset_cost)}
         self.gold = 0                                 # gold:                            0,1,..*
         self.goal_achieved = False                    # indicates whether goal achieved: True/False
         self.visited_node = defaultdict(int)          # location visit counts:           {location: times_visited}
@@ -138,6 +300,9 @@ class Player(BasePlayer):
         self.price_stats = {}                         # stats of market prices        {product: (price var, 75th, 25th)}
         self.profit_order = []                        # A list of products in order to sell
         self.final_turns = 0                          # The count of turns used at the end of the game
+        self.path_cache = None                        # shortest paths for the current map: PathCache
+        self.white_bg = frozenset()                   # black and grey markets nearest_whites is for
+        self.nearest_whites = {}                      # nearest white market to a market: {market: white market}
 
     def take_turn(self, location, prices, info, bm, gm):
         """Player takes a turn with (hopefully) informed choices.
@@ -248,6 +413,9 @@ class Player(BasePlayer):
                 self.gold -= self.black_penalty
             if self.target_loc in bg_set or self.target_loc is None:
                 self.target_loc = self.nearest_white(self.loc, bg_set)
+            # If there is no white market left, stay put
+            if self.target_loc == self.loc:
+                return Command.PASS, None
             return Command.MOVE_TO, self.get_next_step(self.target_loc, bg_set)
 
         # Next highest priority:
@@ -334,9 +502,8 @@ class Player(BasePlayer):
         return Command.MOVE_TO, self.get_next_step(self.target_loc, bg_set)
 
     def get_path_to(self, target_location, bg_set):
-        """Compute and return the path for to a target_location using Uniform Cost Search.
-           Uniform cost search finds the next step base on the lowest cost from first node
-           to the curent node. Cost of nodes are computed in get_location_cost() function.
+        """Compute and return the lowest cost path to a target_location. Moving onto a
+           black/gray market costs BG_COST, onto any other market 1.
 
            Args:
                 target_location (String): Destination to travel to.
@@ -344,64 +511,11 @@ class Player(BasePlayer):
             Output:
                 path (deque): a sequence of market indicating the path to destination.
         """
-        # all nodes in the map
-        nodes = self.map.get_node_names()
-
-        # Since it is a UCS, all nodes necessarily have one previous node. This is required for the backtracking later
-        # All nodes will have a not None node except the starting node
-        # Example: None -> A -> B -> C :: Backtrack None <- A <- B <- C
-        previous = {node: None for node in nodes}
-
-        # Record visited path to prevent cycles during path finding
-        visited = {node: False for node in nodes}
-
-        def get_location_cost(location):
-            """
-            Compute the cost of a location. Higher cost is associated to black/gray
-            markets so player will be inclined to avoid these markets.
-            """
-            # associate a penalty cost for black/gray locations
-            if location in bg_set:
-                return 99
-            else:
-                return 1
-
-        # initialize priority queue, use tuples (cost, location) as nodes
-        # If node is a tuple, heapq compares node cost by refering to the
-        # tuples first element
-        cost = get_location_cost(self.loc)
-        hq = [(cost, self.loc)]
-        heapq.heapify(hq)
-
-        # while queue is not empty
-        while hq:
-            # get the lowest cost node to be explored first
-            current = heapq.heappop(hq)
-            visited[current[1]] = True
-
-            # target found, reconstruct the full path by iteratively backtracking
-            # previous locations of curren node.
-            if current[1] == target_location:
-                path = deque()
-                while current:
-                    path.appendleft(current[1])
-                    current = previous[current[1]]
-                return path
-
-            # Collect the neighbours of this market and iterate over them.
-            # If the neighbours have not been visited, compute its score and add
-            # them to the queue, set the current node as the previous node for
-            # all neighbours.
-            neighbours = self.map.get_neighbours(current[1])
-            for n in neighbours:
-                # only consider unvisited nodes, push neighbour into heap if there
-                # is no other path to neighbour found, or current path is shorter
-                # than previously found path to this node to only explore the shorter path.
-                if not visited[n]:
-                    if previous[n] is None or  current[0] <= previous[n][0]:
-                        cost = current[0] + get_location_cost(n) # cost of previously traversed node + next node cost
-                        heapq.heappush(hq, (cost, n))
-                        previous[n] = current
+        # The paths are kept between calls and only repaired as bg_set grows, see PathCache.
+        if self.path_cache is None or self.path_cache.game_map is not self.map:
+            self.path_cache = PathCache(self.map)
+        self.path_cache.update(bg_set)
+        return self.path_cache.path(self.loc, target_location)
 
     def dist_to(self, from_loc, to_loc):
         """Function to calculate the distance between two points
@@ -450,37 +564,62 @@ class Player(BasePlayer):
 
         return min_node, distance_dict
 
-    def nearest_white(self, target_market, bg_set, assessed=set()):
+    def nearest_white(self, target_market, bg_set):
         """Returns the market location closest to the target market that is white
            If the target market is white, returns the target.
+           Results are kept until bg_set changes, so repeated calls in a turn are free.
         Args:
             bg_set (set): Set of black and grey markets
             target_market (str): Target market from search. 
         
         Output:
-             (str): return the nearest white market from the current location
+             (str): return the nearest white market to the target market, ties going to the first
+                    by name. If no white market can be reached, returns the target market.
         """
         # return the target market if it is a white market
         if target_market not in bg_set:
             return target_market
 
-        # Get the neighbours of the target market that have not been assessed
-        # If this set less the black/grey market set is not empty,
-        # Return a random target white market
-        neighbours = self.map.get_neighbours(target_market)
-        neighbour_set = neighbours - assessed
-        white_set = neighbour_set - bg_set
-        if white_set:
-            return random.choice(list(white_set))
-
-        # Otherwise, the assessed locations and all of the neighbours are black
-        # The assessed should be updated to include all neighbours and a random
-        # next_market chosen from any of the neighbour set
-        else:
-            assessed.add(target_market)
-            assessed = assessed.union(neighbour_set)
-            next_market = random.choice(list(neighbours))
-            return self.nearest_white(next_market, bg_set, assessed)
+        # The black and grey markets only change between turns, forget the old results when they do
+        if bg_set != self.white_bg:
+            self.white_bg = frozenset(bg_set)
+            self.nearest_whites = {}
+
+        # Search outwards from the target market for the closest white market
+        if target_market not in self.nearest_whites:
+            white_set = set(self.map.get_node_names()) - bg_set
+            nearest = self.nearest_market(target_market, white_set)
+            self.nearest_whites[target_market] = target_market if nearest is None else nearest
+        return self.nearest_whites[target_market]
+
+    def nearest_market(self, sources, candidates):
+        """Breadth-first search outwards from the sources, stopping at the first layer that
+        contains a candidate market.
+        Args:
+            sources (str or iterable): market, or markets, to search from.
+            candidates (set): markets being looked for.
+        Output:
+            market (str): the candidate with the fewest moves from any source. Ties go to the
+                          first market by name. None if no candidate can be reached.
+        """
+        if isinstance(sources, str):
+            sources = [sources]
+        visited = set(sources)
+        layer = list(visited)
+        while layer:
+            found = [market for market in layer if market in candidates]
+            if found:
+                return min(found)
+
+            # Collect the unvisited neighbours of this layer as the next layer
+            next_layer = []
+            for market in layer:
+                for n in self.map.get_neighbours(market):
+                    if n not in visited:
+                        visited.add(n)
+                        next_layer.append(n)
+            layer = next_layer
+        return None
 
     def cut_losses(self, prices):
         """Panic button function for the player to decide what part of his inventory to sell if goal is negative.
@@ -501,7 +640,7 @@ class Player(BasePlayer):
             final_assets = -math.inf
             to_sell = None
             sell_num = 0
-            for product, info in self.inventory.items():
+            for product, info in sorted(self.inventory.items()):
                 # Calculate the number of the currently assessed product required to
                 # offset the negative gold cost
                 tmp_num = -int(self.gold // prices[product][0])
@@ -519,7 +658,7 @@ class Player(BasePlayer):
         # If the player does not have enough in his inventory, he will decide to dump the most expensive of
         # any one of the player's inventory.
         if to_sell is None:
-            to_sell = max(self.inventory, key=lambda x: self.inventory[x][0] * prices[x][0])
+            to_sell = max(sorted(self.inventory), key=lambda x: self.inventory[x][0] * prices[x][0])
             sell_num = self.inventory[to_sell][0]
 
         # Return the command tuple for the stategy output
@@ -543,7 +682,7 @@ class Player(BasePlayer):
         Output:
             product (str): the first product that is in excess
         """
-        for product in sell_set:
+        for product in sorted(sell_set):
             if self.excess_stock(product):
                 return product
         return None
@@ -614,19 +753,19 @@ class Player(BasePlayer):
         researched = self.researched
         # First check if there are any available markets that have not been researched
         # If there are any available markets, choose a random one to return
-        avail = list(markets - researched - bg_set - ignore_set)
+        avail = sorted(markets - researched - bg_set - ignore_set)
         if avail:
             return random.choice(avail)
         else:
             # Check if there are any markets that are researched to return
-            avail = list(markets - bg_set - ignore_set)
+            avail = sorted(markets - bg_set - ignore_set)
             if avail:
                 return random.choice(avail)
 
             # The only case where the above set is empty is if the player is in the ignore_set
             # In which case, just return a random location that is not in the black and grey set
             else:
-                return random.choice(list(markets - bg_set))
+                return random.choice(sorted(markets - bg_set))
 
     def update_stats(self, bg_set):
         """Function to update player knowledge on statistics of the market the only useful 
@@ -643,7 +782,7 @@ class Player(BasePlayer):
         # black or grey markets. For this reason, the player will only update the statistics within
         # this region.
         target_region = set(self.market_prices.keys()) - bg_set
-        for market in target_region:
+        for market in sorted(target_region):
             for product in self.market_prices[market].keys():
                 product_price[product].append(self.market_prices[market][product][0])
 
@@ -779,7 +918,7 @@ class Player(BasePlayer):
 
         # calculate the distances to these markets
         dist_to_target = {market: len(self.get_path_to(market, bg_set))
-                          for market in possible_targets if market}
+                          for market in sorted(possible_targets) if market}
         if dist_to_target:
             target_market = min(dist_to_target, key=dist_to_target.get)
         else:
@@ -1120,6 +1259,7 @@ def suite():
     # Movement testing
     test_suite.addTest(MovementTestCase('test_move'))
     test_suite.addTest(MovementTestCase('test_stay'))
+    test_suite.addTest(MovementTestCase('test_bg_update'))
 
     # Knowledge testing
     test_suite.addTest(KnowledgeTestCase('test_check_goal'))
@@ -1206,6 +1346,28 @@ class MovementTestCase(unittest.TestCase):
         self.assertIsNone(next_step)
         self.assertEqual(len(next_path), 1)
 
+    # Tests if paths kept between turns are as cheap as new ones after markets turn grey.
+    # Paths repaired as markets turn black/grey cost the same as a plain Dijkstra search
+    def test_bg_update(self):
+        p = Player()
+        p.map = test_map()
+        p.loc = "A"
+        bg_set = set()
+        cost = lambda path: sum(BG_COST if m in bg_set else 1 for m in list(path)[1:-1])
+        for market in p.get_path_to("V", bg_set).copy():
+            bg_set.add(market)
+            for target in ["V", "K", "S"]:
+                path = p.get_path_to(target, bg_set)
+                self.assertEqual(path[0], "A")
+                self.assertEqual(path[-1], target)
+                steps = list(path)
+                self.assertTrue(all(b in p.map.get_neighbours(a) for a, b in zip(steps, steps[1:])))
+                self.assertEqual(cost(path), test_path_cost(p.map, "A", target, bg_set))
+
+                cache = PathCache(p.map)
+                cache.update(bg_set)
+                self.assertEqual(cost(path), cost(cache.path("A", target)))
+
 
 # Creates test case class for player knowledge functions
 class KnowledgeTestCase(unittest.TestCase):
@@ -1351,6 +1513,25 @@ def test_map(size=26, seed=23624):
     return Map(node_list, map_width, map_height, res_x, res_y, seed=seed)
 
 
+# This function finds the cheapest path cost with a plain Dijkstra search, to check PathCache.
+def test_path_cost(game_map, source, target, bg_set):
+    dist = {source: 0}
+    heap = [(0, source)]
+    while heap:
+        d, node = heapq.heappop(heap)
+        if node == target:
+            return d
+        if d > dist[node]:
+            continue
+        for n in game_map.get_neighbours(node):
+            # Moving onto the target itself is free, as in the path cost
+            nd = d + (0 if n == target else BG_COST if n in bg_set else 1)
+            if nd < dist.get(n, math.inf):
+                dist[n] = nd
+                heapq.heappush(heap, (nd, n))
+    return math.inf
+
+
 # This function helps output a static map for testing.
 def test_static_map():
     class StaticMap(Map):
@@ -0,0 +1,111 @@
+"""
+    Struct-of-arrays storage for the players in a Game.
+
+    One row per player: location id, turns at location, gold, and a
+    players x products inventory and goal matrix. Per turn charges and
+    scoring run as NumPy operations over all players at once.
+"""
+import numpy as np
+
+
+class PlayerTable:
+    def __init__(self, node_names, products, gold_key, capacity=8, node_ids=None):
+        """ @param node_names List of node names, location ids index into this list.
+            @param products List of product names, columns of inv and goal.
+            @param gold_key Inventory key used for gold.
+            @param node_ids {node name: index in node_names}, eg. Map.get_node_ids(). Made from node_names if None.
+        """
+        self.node_names = tuple(node_names)
+        self.node_ids = {node: i for i, node in enumerate(self.node_names)} if node_ids is None else node_ids
+        self.products = list(products)
+        self.product_index = {prod: i for i, prod in enumerate(self.products)}
+        self.gold_key = gold_key
+
+        self.size = 0
+        self.loc = np.zeros(capacity, dtype=np.int32)
+        self.n = np.zeros(capacity, dtype=np.int32)
+        self.gold = np.zeros(capacity, dtype=np.float64)
+        self.inv = np.zeros((capacity, len(self.products)), dtype=np.int64)
+        self.goal = np.zeros((capacity, len(self.products)), dtype=np.int64)
+
+    def add(self, loc, gold, goal):
+        """Add a player with an empty inventory.
+           @param loc str start location.
+           @param gold start gold.
+           @param goal dict {product:amount}.
+           @return row index of the new player.
+        """
+        if self.size == len(self.gold):
+            grow = max(len(self.gold), 1)
+            self.loc = np.concatenate([self.loc, np.zeros(grow, dtype=self.loc.dtype)])
+            self.n = np.concatenate([self.n, np.zeros(grow, dtype=self.n.dtype)])
+            self.gold = np.concatenate([self.gold, np.zeros(grow, dtype=self.gold.dtype)])
+            self.inv = np.concatenate([self.inv, np.zeros((grow, self.inv.shape[1]), dtype=self.inv.dtype)])
+            self.goal = np.concatenate([self.goal, np.zeros((grow, self.goal.shape[1]), dtype=self.goal.dtype)])
+
+        row = self.size
+        self.loc[row] = self.node_ids[loc]
+        self.gold[row] = gold
+        for prod, amount in goal.items():
+            self.goal[row, self.product_index[prod]] = amount
+        self.size += 1
+        return row
+
+    def charge(self, interest, black_nodes, penalty):
+        """Charge interest on negative gold, then the penalty to every player on a black node.
+           @param interest rate in [0,1].
+           @param black_nodes iterable of node names that are black.
+           @param penalty gold charged per turn on a black node.
+           @return (interest charged per player, bool array of players penalised)
+        """
+        gold = self.gold[:self.size]
+        charged = np.where(gold < 0, -interest * gold, 0.0)
+        gold -= charged
+
+        black = np.zeros(len(self.node_names), dtype=bool)
+        black[[self.node_ids[node] for node in black_nodes]] = True
+        outside = black[self.loc[:self.size]]
+        gold[outside] -= penalty
+
+        return charged, outside
+
+    def scores(self, bonus):
+        """@return List of scores, bonus for every goal met plus gold, in row order.
+        """
+        met = (self.inv[:self.size] >= self.goal[:self.size]).sum(axis=1)
+        return (bonus * met + self.gold[:self.size]).tolist()
+
+    def inventory(self, row):
+        return InventoryView(self, row)
+
+
+class InventoryView:
+    """Dictionary-like view of one row of the table, keyed by product and gold key.
+       Values are returned as Python int/float so they can be passed to Market.
+    """
+    def __init__(self, table, row):
+        self.table = table
+        self.row = row
+
+    def __getitem__(self, key):
+        if key == self.table.gold_key:
+            return float(self.table.gold[self.row])
+        return int(self.table.inv[self.row, self.table.product_index[key]])
+
+    def __setitem__(self, key, value):
+        if key == self.table.gold_key:
+            self.table.gold[self.row] = value
+        else:
+            self.table.inv[self.row, self.table.product_index[key]] = value
+
+    def keys(self):
+        return self.table.products + [self.table.gold_key]
+
+    def items(self):
+        return [(k, self[k]) for k in self.keys()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __repr__(self):
+        return repr(dict(self.items()))
@@ -0,0 +1,226 @@
+"""
+    Compact binary record of a Game, and a player to rebuild the game state at any turn.
+
+    File layout:
+        MAGIC, VERSION
+        header      zlib compressed JSON: seed, map, products, prices and the state before turn 1
+        records     one fixed width RECORD per event, in the order they happened
+        footer      zlib compressed JSON: keyframes (full state every keyframe_every turns)
+        trailer     footer offset and length
+
+    A record is (turn, player, kind, product, node, amount, value), see KINDS for
+    what each field means per kind. state_at(turn) starts from the last keyframe at
+    or before turn and applies the records after it, without running any player code.
+"""
+import json
+import struct
+import zlib
+
+import EventLog
+from Game import INFO_LOC, INFO_INV, INFO_GOAL, INV_GOLD
+from Market import PRODUCTS
+
+MAGIC = b"MRREPLAY"
+VERSION = 1
+
+HEADER = struct.Struct("<8sHI")      # magic, version, header length
+RECORD = struct.Struct("<IHBBIid")   # turn, player, kind, product, node, amount, value
+TRAILER = struct.Struct("<QI")       # footer offset, footer length
+
+    # Record kinds. Fields used:       node          product  amount    value
+KINDS = [EventLog.MOVE,              # destination
+         EventLog.NO_MOVE,           # location
+         EventLog.BUY,               # location      yes      bought    cost
+         EventLog.SELL,              # location      yes      sold      cost
+         EventLog.RESEARCH,          # location
+         EventLog.PASS,              # location
+         EventLog.REFUSED,           # location
+         EventLog.INTEREST,          #                                  interest charged
+         EventLog.PENALTY,           # location                         penalty charged
+         EventLog.STATUS]            # node                   status
+KIND_CODES = {kind:code for code, kind in enumerate(KINDS)}
+
+
+def capture_state(game, node_index):
+    """@return JSON-able state of game: player locations, gold and inventories, market stock and circle status.
+    """
+    players = {p_id:[node_index[p_info[INFO_LOC]], p_info[INFO_INV][INV_GOLD], [p_info[INFO_INV][k] for k in PRODUCTS]]
+               for p_id, p_info in game.players.items()}
+    amounts = []
+    for node in node_index:
+        pa = game.markets[node].get_price_amount()
+        amounts.append([pa[k][1] for k in PRODUCTS])
+    status = [game.map.node_status[node] for node in node_index]
+    return {"turn":game.turn_num, "players":players, "amounts":amounts, "status":status}
+
+
+class ReplayRecorder:
+    def __init__(self, path, keyframe_every=50):
+        """ @param path File to write.
+            @param keyframe_every Turns between full copies of the state.
+        """
+        self.path = path
+        self.keyframe_every = keyframe_every
+        self.f = None
+        self.keyframes = []
+        self.num_records = 0
+
+    def start(self, game):
+        """Write the header and the state before the next turn, the first unless the game was loaded.
+           Does nothing if already started.
+        """
+        if self.f is not None:
+            return
+        nodes = list(game.map.get_node_names())
+        self.node_index = game.map.get_node_ids()
+        self.product_index = {prod:i for i, prod in enumerate(PRODUCTS)}
+
+        offsets, indices = game.map.get_adjacency()
+        header = {"seed":game.seed,
+                  "nodes":nodes,
+                  "positions":[game.map.map_data['node_positions'][node][:2] for node in nodes],
+                  "graph":[indices[offsets[i]:offsets[i + 1]].tolist() for i in range(len(nodes))],
+                  "products":PRODUCTS,
+                  "prices":[[game.markets[node].get_prices()[k] for k in PRODUCTS] for node in nodes],
+                  "goals":{p_id:[p_info[INFO_GOAL][k] for k in PRODUCTS] for p_id, p_info in game.players.items()},
+                  "start":capture_state(game, self.node_index)}
+        data = zlib.compress(json.dumps(header).encode())
+
+        self.f = open(self.path, "wb")
+        self.f.write(HEADER.pack(MAGIC, VERSION, len(data)))
+        self.f.write(data)
+        self.keyframes = [{"turn":game.turn_num, "record":0, "state":header["start"]}]
+
+    def record(self, turn, p_id, kind, fields):
+        """Write one record for an event emitted by the game (see EventLog).
+        """
+        code = KIND_CODES.get(kind)
+        if code is None:
+            return
+        if kind == EventLog.MOVE:
+            node = fields["dst"]
+        elif kind == EventLog.NO_MOVE:
+            node = fields["src"]
+        else:
+            node = fields.get("node")
+
+        amount, value = 0, 0.0
+        if kind == EventLog.BUY or kind == EventLog.SELL:
+            amount, value = fields["amount"], fields["cost"]
+        elif kind == EventLog.INTEREST or kind == EventLog.PENALTY:
+            value = fields["amount"]
+        elif kind == EventLog.STATUS:
+            amount = fields["status"]
+
+        product = self.product_index.get(fields.get("product"), 0)
+        self.f.write(RECORD.pack(turn, p_id or 0, code, product, self.node_index.get(node, 0), amount, value))
+        self.num_records += 1
+
+    def end_turn(self, game):
+        """Keep a keyframe every keyframe_every turns.
+        """
+        if game.turn_num % self.keyframe_every == 0:
+            self.keyframes.append({"turn":game.turn_num, "record":self.num_records,
+                                   "state":capture_state(game, self.node_index)})
+
+    def write_footer(self):
+        """Write the footer and trailer after the records so far, and truncate anything after them.
+           @return Offset of the footer, where the next record goes.
+        """
+        footer = zlib.compress(json.dumps({"num_records":self.num_records, "keyframes":self.keyframes}).encode())
+        offset = self.f.tell()
+        self.f.write(footer)
+        self.f.write(TRAILER.pack(offset, len(footer)))
+        self.f.truncate()
+        return offset
+
+    def checkpoint(self):
+        """Make the file a complete replay of the game so far, eg. when the game is saved.
+           Recording carries on over the footer, which close() writes again at the end.
+        """
+        if self.f is None:
+            return
+        offset = self.write_footer()
+        self.f.flush()
+        self.f.seek(offset)
+
+    def close(self):
+        if self.f is None:
+            return
+        self.write_footer()
+        self.f.close()
+        self.f = None
+
+
+class Replay:
+    def __init__(self, path):
+        """Read a file written by ReplayRecorder.
+        """
+        with open(path, "rb") as f:
+            data = f.read()
+
+        magic, version, header_len = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("{} is not a version {} replay".format(path, VERSION))
+        self.header = json.loads(zlib.decompress(data[HEADER.size:HEADER.size + header_len]))
+
+        footer_offset, footer_len = TRAILER.unpack_from(data, len(data) - TRAILER.size)
+        footer = json.loads(zlib.decompress(data[footer_offset:footer_offset + footer_len]))
+        self.keyframes = footer["keyframes"]
+        self.num_records = footer["num_records"]
+
+        self.nodes = self.header["nodes"]
+        self.products = self.header["products"]
+        self.seed = self.header["seed"]
+        self.body = memoryview(data)[HEADER.size + header_len:footer_offset]
+
+    def record(self, i):
+        """@return Record i as (turn, player, kind, product, node, amount, value), kind as an EventLog kind.
+        """
+        turn, p_id, code, product, node, amount, value = RECORD.unpack_from(self.body, i * RECORD.size)
+        return turn, p_id, KINDS[code], product, node, amount, value
+
+    def records(self, start=0, stop=None):
+        """@return Generator of records start..stop-1.
+        """
+        stop = self.num_records if stop is None else stop
+        for i in range(start, stop):
+            yield self.record(i)
+
+    def state_at(self, turn):
+        """@return State at the end of turn (turn 0 is the start of the game):
+                   {"turn":turn,
+                    "players":{p_id:{"loc":node, "gold":gold, "inventory":{product:amount}}},
+                    "markets":{node:{product:amount}},
+                    "status":{node:Map.NODE_STATUS_*}}
+        """
+        key = max((k for k in self.keyframes if k["turn"] <= turn), key=lambda k: k["turn"])
+        state = key["state"]
+        players = {int(p_id):[loc, gold, list(inv)] for p_id, (loc, gold, inv) in state["players"].items()}
+        amounts = [list(a) for a in state["amounts"]]
+        status = list(state["status"])
+
+        for i in range(key["record"], self.num_records):
+            t, p_id, kind, product, node, amount, value = self.record(i)
+            if t > turn:
+                break
+            if kind == EventLog.MOVE:
+                players[p_id][0] = node
+            elif kind == EventLog.BUY:
+                players[p_id][2][product] += amount
+                players[p_id][1] -= value
+                amounts[node][product] -= amount
+            elif kind == EventLog.SELL:
+                players[p_id][2][product] -= amount
+                players[p_id][1] += value
+                amounts[node][product] += amount
+            elif kind == EventLog.INTEREST or kind == EventLog.PENALTY:
+                players[p_id][1] -= value
+            elif kind == EventLog.STATUS:
+                status[node] = amount
+
+        return {"turn":turn,
+                "players":{p_id:{"loc":self.nodes[loc], "gold":gold, "inventory":dict(zip(self.products, inv))}
+                           for p_id, (loc, gold, inv) in players.items()},
+                "markets":{node:dict(zip(self.products, a)) for node, a in zip(self.nodes, amounts)},
+                "status":dict(zip(self.nodes, status))}
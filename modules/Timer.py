@@ -1,6 +1,8 @@
 import threading
 import multiprocessing
 import platform
+import traceback
+import random
 
 TIME = 0.1   # seconds for one turn
 
@@ -42,6 +44,129 @@ class Timer():
             raise e
 
 
+class WorkerError(Exception):
+    """Raised in the game process when a player method raised inside its worker.
+       The message is the traceback formatted in the worker.
+    """
+    pass
+
+
+class PlayerWorker():
+    """A long-lived process that owns one Player object for the whole game.
+
+    The game sends (method name, args) down a pipe and waits at most `duration`
+    seconds for the reply, so each decision is computed exactly once and no
+    process is forked per turn. Player state lives in the worker; the Player
+    object held by the game is left as it was when the worker started.
+
+    A worker that runs out of time is stopped and its player state is lost with it,
+    so the player stays timed out: later calls return None without starting a new worker.
+
+    On Windows there is no fork, so calls run directly in the game process
+    without a time limit (same as Timer.timeout).
+    """
+    def __init__(self, player, seed=None, random_state=None):
+        """ @param player The Player object, used in the worker as it is when start() is called.
+            @param seed If not None, the worker seeds the global random module with it. A player
+                        only replays from the same seed if its choices don't depend on the order
+                        of sets or dicts of str, which changes with PYTHONHASHSEED.
+            @param random_state If not None, the worker sets the global random module to this
+                                state (from fetch) instead of seeding it.
+        """
+        self.player = player
+        self.seed = seed
+        self.random_state = random_state
+        self.process = None
+        self.conn = None
+        self.timed_out = False
+        self.direct = platform.system() == "Windows"
+
+    def start(self):
+        if self.direct or self.process is not None or self.timed_out:
+            return
+        ctx = multiprocessing.get_context("fork")
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=PlayerWorker.serve, args=(self.player, child_conn, self.seed, self.random_state), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def serve(player, conn, seed=None, random_state=None):
+        """Worker loop: run requested player methods until told to stop."""
+        if random_state is not None:
+            random.setstate(random_state)
+        elif seed is not None:
+            random.seed(seed)
+        with silence_stdout():
+            while True:
+                try:
+                    request = conn.recv()
+                except EOFError:
+                    break
+                if request is None:
+                    break
+                name, args, kwargs = request
+                if name is None:
+                    conn.send((True, (player, random.getstate())))
+                    continue
+                try:
+                    conn.send((True, getattr(player, name)(*args, **kwargs)))
+                except Exception:
+                    conn.send((False, traceback.format_exc()))
+        conn.close()
+
+    def call(self, name, args=(), kwargs={}, duration=TIME):
+        """Call player.name(*args, **kwargs) in the worker.
+           @return result of the call, or None if duration is exceeded (the worker is then stopped)
+                   or was exceeded by an earlier call.
+           @raise WorkerError if the player method raised.
+        """
+        if self.direct:
+            return getattr(self.player, name)(*args, **kwargs)
+        if self.timed_out:
+            return None
+
+        self.start()
+        self.conn.send((name, args, kwargs))
+        if not self.conn.poll(duration):
+            self.process.terminate()
+            self.process.join()
+            self.conn.close()
+            self.process = None
+            self.timed_out = True
+            return None
+
+        ok, result = self.conn.recv()
+        if not ok:
+            raise WorkerError(result)
+        return result
+
+    def fetch(self):
+        """Copy the worker's Player object, in its current state, and the state of the
+           worker's global random module back into self.player and self.random_state.
+           A timed out worker has no state left, self.player is then as it was when the worker started.
+           @return self.player
+        """
+        if self.direct or self.process is None:
+            return self.player
+        self.conn.send((None, (), {}))
+        ok, (self.player, self.random_state) = self.conn.recv()
+        return self.player
+
+    def close(self):
+        if self.process is None:
+            return
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(TIME)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.conn.close()
+        self.process = None
+
+
 from contextlib import contextmanager
 import os,sys
 
@@ -0,0 +1,116 @@
+"""
+Runs many independent games of Market Royale in parallel.
+
+Each game is played in its own process from a pool, and results are
+yielded as soon as each game finishes.
+
+Example (7 of each player, 1000 games, all cores):
+    python Tournament.py Player:Player Player2:Player --games 1000 --seats 7 7
+"""
+import argparse
+import importlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import Game
+
+
+def play_one(game_index, player_classes, seating, num_turns, game_kwargs):
+    """Play a single game in the current process.
+       @param player_classes List of BasePlayer subclasses.
+       @param seating List of ints, number of players of each class in the game.
+       @return (game_index, scores, error) where scores is a list with one list of
+               scores per class (in seating order), or None and the error message.
+    """
+    players = []
+    for cls, n in zip(player_classes, seating):
+        players += [cls() for _ in range(n)]
+
+    res = Game.Game(players, **game_kwargs).run_game(num_turns)
+    if isinstance(res, tuple):
+        return game_index, None, "{}: {}".format(type(res[0]).__name__, res[1])
+
+    scores = []
+    start = 0
+    for n in seating:
+        scores.append(res[start:start + n])
+        start += n
+    return game_index, scores, None
+
+
+def run_tournament(player_classes, num_games, seating, processes=None, num_turns=Game.NUM_TURNS, seed=None,
+                   **game_kwargs):
+    """Play num_games games across a pool of processes.
+       @param player_classes List of BasePlayer subclasses (must be importable by the workers).
+       @param num_games Number of games to play.
+       @param seating List of ints, number of players of each class in every game.
+       @param processes Number of worker processes, defaults to the number of cores.
+       @param num_turns Turns per game.
+       @param seed If not None, game i is played with seed + i so the whole tournament can be replayed.
+       @param game_kwargs Passed on to the Game constructor.
+       @return Generator of (game_index, scores, error) in order of completion. A game that could not be
+               run, eg. because its worker died, is (game_index, None, error message). Closing the generator
+               early cancels the games that have not started.
+    """
+    assert(len(player_classes) == len(seating))
+    with ProcessPoolExecutor(max_workers=processes or os.cpu_count()) as pool:
+        futures = {}
+        for i in range(num_games):
+            if seed is not None:
+                game_kwargs = dict(game_kwargs, seed=seed + i)
+            futures[pool.submit(play_one, i, player_classes, seating, num_turns, game_kwargs)] = i
+        try:
+            for f in as_completed(futures):
+                try:
+                    result = f.result()
+                except Exception as e:
+                    result = futures[f], None, "{}: {}".format(type(e).__name__, e)
+                yield result
+        except GeneratorExit:
+            pool.shutdown(cancel_futures=True)
+            raise
+
+
+def load_class(spec):
+    """@param spec str "module:Class", eg. "Player2:Player".
+       @return the class.
+    """
+    module, _, name = spec.partition(":")
+    return getattr(importlib.import_module(module), name or "Player")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run Market Royale games in parallel.")
+    parser.add_argument("players", nargs="+", help='player classes as "module:Class"')
+    parser.add_argument("--games", type=int, default=100, help="number of games to run")
+    parser.add_argument("--seats", type=int, nargs="+", help="number of each player per game (default 1 each)")
+    parser.add_argument("--processes", type=int, default=None, help="worker processes (default all cores)")
+    parser.add_argument("--turns", type=int, default=Game.NUM_TURNS, help="turns per game")
+    parser.add_argument("--seed", type=int, default=None, help="seed of the first game, game i uses seed + i")
+    parser.add_argument("--map", default="medium", help="map preset, small, medium or large")
+    parser.add_argument("--map-cache", default=None, help="directory to keep generated maps in")
+    args = parser.parse_args()
+
+    classes = [load_class(s) for s in args.players]
+    seating = args.seats or [1] * len(classes)
+    totals = [[] for _ in classes]
+    errors = 0
+
+    start = time.time()
+    for game_index, scores, error in run_tournament(classes, args.games, seating, args.processes, args.turns, args.seed,
+                                                     map_preset=args.map, map_cache=args.map_cache):
+        if error:
+            errors += 1
+            print("Game {} failed: {}".format(game_index, error))
+            continue
+        print(game_index, scores)
+        for total, s in zip(totals, scores):
+            total += s
+    time_taken = time.time() - start
+
+    print(f"Number of games run is {args.games} ({errors} failed)")
+    for spec, n, total in zip(args.players, seating, totals):
+        if total:
+            print(f"{spec} x{n}: average = {sum(total)/len(total):.2f}, range = [{min(total)}, {max(total)}]")
+    print(f"Time taken: {time_taken:.2f} seconds")
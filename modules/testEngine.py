@@ -0,0 +1,457 @@
+"""
+Tests of the game engine: Game, Map, markets, player table and replays.
+
+Run with:
+    python testEngine.py
+"""
+import unittest
+
+import numpy as np
+
+import contextlib
+from collections import defaultdict, deque
+import io
+import os
+import random
+import tempfile
+import time
+
+import Command
+import Game
+import Player
+import Player2
+import Replay
+import Tournament
+from BasePlayer import BasePlayer
+from Map import Map, HOP_TABLE_MAX_NODES, MAP_PRESETS, map_memo
+from Market import Market, MarketBook, PRODUCTS, P_BOUNDS
+from PlayerTable import PlayerTable
+
+
+# Define the test suite for all test cases.
+def suite():
+    test_suite = unittest.TestSuite()
+
+    # Game testing
+    test_suite.addTest(GameTestCase('test_base_player'))
+    test_suite.addTest(GameTestCase('test_read_only_inputs'))
+    test_suite.addTest(GameTestCase('test_map'))
+    test_suite.addTest(GameTestCase('test_save'))
+
+    # Map testing
+    test_suite.addTest(MapTestCase('test_circle'))
+    test_suite.addTest(MapTestCase('test_render'))
+    test_suite.addTest(MapTestCase('test_cached'))
+    test_suite.addTest(MapTestCase('test_hops'))
+    test_suite.addTest(MapTestCase('test_adjacency'))
+
+    # Market testing
+    test_suite.addTest(MarketTestCase('test_market_view'))
+    test_suite.addTest(MarketTestCase('test_batch'))
+
+    # Replay testing
+    test_suite.addTest(ReplayTestCase('test_state_at'))
+
+    # Player table testing
+    test_suite.addTest(PlayerTableTestCase('test_scores'))
+    test_suite.addTest(PlayerTableTestCase('test_charge'))
+
+    # Tournament testing
+    test_suite.addTest(TournamentTestCase('test_errors'))
+    test_suite.addTest(TournamentTestCase('test_close'))
+
+    return test_suite
+
+
+class InputsPlayer(BasePlayer):
+    """Keeps the types of its take_turn arguments, researching then passing."""
+    def __init__(self):
+        super().__init__()
+        self.types = set()
+
+    def take_turn(self, loc, this_market, info, black_markets, grey_markets):
+        self.types.add((type(this_market), type(info), type(black_markets), type(grey_markets)))
+        if this_market:
+            return Command.PASS, None
+        return Command.RESEARCH, None
+
+
+class GameTestCase(unittest.TestCase):
+    # take_turn gets the dicts and lists BasePlayer asserts, also in this process
+    def test_base_player(self):
+        res = Game.Game([BasePlayer(), BasePlayer()], use_workers=False, seed=1).run_game(20)
+        self.assertEqual(len(res), 2)
+
+        p = InputsPlayer()
+        Game.Game([p, BasePlayer()], use_workers=False, seed=1).run_game(20)
+        self.assertEqual(p.types, {(dict, dict, list, list)})
+
+    # Read-only views are only passed when asked for
+    def test_read_only_inputs(self):
+        p = InputsPlayer()
+        Game.Game([p], use_workers=False, read_only_inputs=True, seed=1).run_game(20)
+        self.assertEqual(p.types, {(Game.MappingProxyType, Game.MappingProxyType, tuple, tuple)})
+
+    # A game can be played on any map, even one too big for hop tables
+    def test_map(self):
+        game_map = Map(["n{}".format(i) for i in range(HOP_TABLE_MAX_NODES + 1)], 2000, 1000, 2, 3, seed=5)
+        game = Game.Game([InputsPlayer(), BasePlayer()], seed=1, map=game_map)
+        self.assertEqual(game.map.get_node_names(), game_map.get_node_names())
+        self.assertEqual(len(game.run_game(5)), 2)
+        self.assertNotIn('dist', game.map.shared_tables())
+
+        # The game moved its own circle, not the circle of game_map
+        self.assertEqual(game.map.circle_turn, 5)
+        self.assertEqual(game_map.circle_turn, 0)
+
+    # Saving leaves a readable replay, and a loaded game logs and records again
+    def test_save(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            save_path = os.path.join(tmp, "game.save")
+            replay_path = os.path.join(tmp, "game.replay")
+            with contextlib.redirect_stdout(io.StringIO()):
+                game = Game.Game([BasePlayer(), BasePlayer()], verbose=True, use_workers=False, seed=1,
+                                 recorder=Replay.ReplayRecorder(replay_path, keyframe_every=5))
+                self.assertIsNone(game.run_game(20, pause_at=10))
+            game.save(save_path)
+            self.assertEqual(Replay.Replay(replay_path).keyframes[-1]["turn"], 10)
+
+            # The first game keeps recording after the save
+            with contextlib.redirect_stdout(io.StringIO()):
+                res = game.run_game(20)
+            replay = Replay.Replay(replay_path)
+            self.assertEqual(replay.keyframes[-1]["turn"], 20)
+
+            loaded_path = os.path.join(tmp, "loaded.replay")
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                loaded = Game.Game.load(save_path, recorder=Replay.ReplayRecorder(loaded_path, keyframe_every=5))
+                self.assertEqual(loaded.run_game(20), res)
+            self.assertIn('"turn": 11', out.getvalue())
+
+            loaded_replay = Replay.Replay(loaded_path)
+            self.assertEqual(loaded_replay.keyframes[0]["turn"], 10)
+            self.assertEqual(loaded_replay.state_at(20), replay.state_at(20))
+
+
+# The node statuses after each of turns calls to move_circle, found as move_circle used to:
+# by shrinking the circle and checking every node against it each turn
+def rescan_statuses(game_map, num_turns_in_game, turns):
+    positions = game_map.map_data['node_positions']
+    status = {node:node_status for node, (_, _, node_status) in positions.items()}
+    circle = {'x_min':0, 'x_max':game_map.map_width, 'y_min':0, 'y_max':game_map.map_height}
+    min_width, min_height = game_map.map_width / 4, game_map.map_height / 4
+    statuses = []
+    for _ in range(turns):
+        status = {node:Map.NODE_STATUS_BLACK if s == Map.NODE_STATUS_GREY else s for node, s in status.items()}
+        circle['x_min'] += (game_map.map_width / 2) / num_turns_in_game
+        circle['x_max'] -= (game_map.map_width / 2) / num_turns_in_game
+        circle['y_min'] += (game_map.map_height / 2) / num_turns_in_game
+        circle['y_max'] -= (game_map.map_height / 2) / num_turns_in_game
+        if circle['x_max'] - circle['x_min'] < min_width:
+            circle['x_min'] = (game_map.map_width / 2) - min_width / 2
+            circle['x_max'] = (game_map.map_width / 2) + min_width / 2
+        if circle['y_max'] - circle['y_min'] < min_height:
+            circle['y_min'] = (game_map.map_height / 2) - min_height / 2
+            circle['y_max'] = (game_map.map_height / 2) + min_height / 2
+        for node, (x, y, _) in positions.items():
+            outside = x <= circle['x_min'] or x >= circle['x_max'] or y <= circle['y_min'] or y >= circle['y_max']
+            if outside and status[node] != Map.NODE_STATUS_BLACK:
+                status[node] = Map.NODE_STATUS_GREY
+        statuses.append(status)
+    return statuses
+
+
+# The map drawn as render_map used to draw it: stepping along each road one sample at a time
+def loop_render(game_map):
+    rows = [[Map.EMPTY_ICON] * int(game_map.map_width / game_map.resolution_x)
+            for _ in range(int(game_map.map_height / game_map.resolution_y))]
+
+    def set_icon(x, y, icon):
+        x_block, y_block = int(x / game_map.resolution_x), int(y / game_map.resolution_y)
+        if 0 <= x_block < len(rows[0]) and 0 <= y_block < len(rows):
+            rows[y_block][x_block] = icon
+
+    positions = game_map.map_data["node_positions"]
+    for node, other_nodes in game_map.map_data["node_graph"].items():
+        for other_node in other_nodes:
+            if node == other_node:
+                continue
+            start, end = positions[node][:2], positions[other_node][:2]
+            dx, dy = Map.dx_dy_between_pos(start, end)
+            step_x, step_y = abs(dx / Map.SAMPLING_AMOUNT_PER_LINE), abs(dy / Map.SAMPLING_AMOUNT_PER_LINE)
+            x, y = start
+            left = Map.distance_between_pos(start, end)
+            while left > (step_x ** 2 + step_y ** 2) ** 0.5:
+                x += step_x if x < end[0] else -step_x
+                y += step_y if y < end[1] else -step_y
+                set_icon(x, y, Map.PATH_ICON)
+                left = Map.distance_between_pos((x, y), end)
+
+    icons = {Map.NODE_STATUS_GREY:Map.NODE_STATUS_GREY_ICON, Map.NODE_STATUS_BLACK:Map.NODE_STATUS_BLACK_ICON}
+    for node, (x, y, _) in positions.items():
+        set_icon(x, y, icons.get(game_map.node_status[node], node[0]))
+    return ["".join(row) for row in rows]
+
+
+# Hop distance from source to every node it reaches, by a BFS over map_data['node_graph']
+def bfs_distances(game_map, source):
+    graph = game_map.map_data['node_graph']
+    dist = {source:0}
+    queue = deque([source])
+    while queue:
+        node = queue.popleft()
+        for other in graph.get(node, ()):
+            if other not in dist:
+                dist[other] = dist[node] + 1
+                queue.append(other)
+    return dist
+
+
+class MapTestCase(unittest.TestCase):
+    # The circle schedule turns the nodes grey and black on the turns a full rescan does
+    def test_circle(self):
+        for name in MAP_PRESETS:
+            game_map = Map.preset(name)
+            expected = rescan_statuses(game_map, 50, 80)
+            self.assertTrue(any(s == Map.NODE_STATUS_BLACK for s in expected[-1].values()))
+
+            # status_at knows every turn before the circle has moved
+            ahead = Map.preset(name)
+            for turn, status in enumerate(expected, 1):
+                self.assertEqual({node:ahead.status_at(node, turn, 50) for node in status}, status)
+
+            for turn, status in enumerate(expected, 1):
+                game_map.move_circle(50)
+                self.assertEqual(game_map.node_status, status)
+                self.assertEqual(set(game_map.get_grey_nodes()), {n for n, s in status.items() if s == Map.NODE_STATUS_GREY})
+                self.assertEqual(set(game_map.get_black_nodes()), {n for n, s in status.items() if s == Map.NODE_STATUS_BLACK})
+                self.assertEqual({node:game_map.status_at(node, turn) for node in status}, status)
+
+    # The vectorised render draws the same map as stepping along every road
+    def test_render(self):
+        maps = [Map.preset(name) for name in MAP_PRESETS]
+        maps += [Map(["n{}".format(i) for i in range(60)], 300, 150, 3, 2, seed=seed) for seed in range(3)]
+        for game_map in maps:
+            self.assertEqual(game_map.frozen().map_2d, tuple(loop_render(game_map)))
+
+            game_map.node_status[game_map.get_node_names()[0]] = Map.NODE_STATUS_GREY
+            game_map.node_status[game_map.get_node_names()[1]] = Map.NODE_STATUS_BLACK
+            game_map.render_map()
+            self.assertEqual(["".join(row) for row in game_map.map_2d], loop_render(game_map))
+
+    # Cached maps, kept in memory or read back from the cache directory, are the map Map(...) makes
+    def test_cached(self):
+        nodes = ["n{}".format(i) for i in range(40)]
+        fresh = Map(nodes, 200, 100, 2, 3, seed=77)
+        graph = lambda m: {node:set(others) for node, others in m.map_data['node_graph'].items() if others}
+        with tempfile.TemporaryDirectory() as tmp:
+            maps = [Map.cached(nodes, 200, 100, 2, 3, 77, cache_dir=tmp)]
+            maps.append(Map.cached(nodes, 200, 100, 2, 3, 77, cache_dir=tmp))
+            self.assertEqual(len(os.listdir(tmp)), 1)
+            map_memo.clear()
+            maps.append(Map.cached(nodes, 200, 100, 2, 3, 77, cache_dir=tmp))
+
+        for game_map in maps:
+            self.assertEqual(game_map.get_node_names(), fresh.get_node_names())
+            self.assertEqual(game_map.map_data['node_positions'], fresh.map_data['node_positions'])
+            self.assertEqual(graph(game_map), graph(fresh))
+            self.assertEqual(game_map.frozen().map_2d, fresh.frozen().map_2d)
+
+        # Each map has its own circle
+        for _ in range(40):
+            maps[0].move_circle(50)
+            fresh.move_circle(50)
+        self.assertEqual(maps[0].node_status, fresh.node_status)
+        self.assertNotEqual(maps[1].node_status, fresh.node_status)
+        self.assertEqual(maps[1].circle_turn, 0)
+
+    # distance, next_hop and path from the hop tables agree with a BFS, also between unconnected nodes
+    def test_hops(self):
+        maps = [Map.preset(name) for name in MAP_PRESETS]
+        maps.append(Map.from_data({"A":(10, 10, 0), "B":(20, 20, 0), "C":(30, 30, 0), "D":(50, 50, 0)},
+                                  defaultdict(set, {"A":{"B"}, "B":{"A", "C"}, "C":{"B"}}), 100, 100, 2, 3))
+        for game_map in maps:
+            names = game_map.get_node_names()
+            graph = game_map.map_data['node_graph']
+            dist = {node:bfs_distances(game_map, node) for node in names}
+            for a in names:
+                for b in names:
+                    d = dist[a].get(b)
+                    self.assertEqual(game_map.distance(a, b), d)
+
+                    hop = game_map.next_hop(a, b)
+                    path = game_map.path(a, b)
+                    if d is None:
+                        self.assertIsNone(hop)
+                        self.assertIsNone(path)
+                        continue
+                    if a == b:
+                        self.assertIsNone(hop)
+                    else:
+                        # The neighbour with the lowest id of those on a shortest path
+                        on_path = [n for n in names if n in graph[a] and dist[n].get(b) == d - 1]
+                        self.assertEqual(hop, on_path[0])
+                    self.assertEqual(len(path), d + 1)
+                    self.assertEqual((path[0], path[-1]), (a, b))
+                    self.assertTrue(all(y in graph[x] for x, y in zip(list(path), list(path)[1:])))
+
+    # Node ids and the CSR adjacency hold the same roads as map_data, for every map and its frozen copy
+    def test_adjacency(self):
+        maps = [Map.preset(name) for name in MAP_PRESETS]
+        maps += [Map(["n{}".format(i) for i in range(200)], 2000, 1000, 2, 3, seed=seed) for seed in range(3)]
+        for game_map in maps:
+            for m in (game_map, game_map.frozen(), game_map.copy()):
+                names = m.get_node_names()
+                self.assertEqual(list(names), list(m.map_data['node_positions']))
+                self.assertEqual(dict(m.get_node_ids()), {node:i for i, node in enumerate(names)})
+                self.assertTrue(all(m.node_name(m.node_id(node)) == node for node in names))
+
+                offsets, indices = m.get_adjacency()
+                self.assertEqual(len(offsets), len(names) + 1)
+                for i, node in enumerate(names):
+                    neighbours = indices[offsets[i]:offsets[i + 1]].tolist()
+                    self.assertEqual(neighbours, sorted(neighbours))
+                    self.assertEqual({names[j] for j in neighbours}, set(m.get_neighbours(node)))
+                    self.assertTrue(all(m.is_road(node, names[j]) for j in neighbours))
+
+
+# Markets with the prices of each row of book
+def book_markets(book):
+    markets = {}
+    for node in book.nodes:
+        markets[node] = Market()
+        markets[node].prices = book.get_prices(node)
+    return markets
+
+
+class MarketTestCase(unittest.TestCase):
+    # A row of a MarketBook trades like a Market with the same prices
+    def test_market_view(self):
+        rng = random.Random(2)
+        book = MarketBook(list("ABCD"), np.random.default_rng(2))
+        markets = book_markets(book)
+        for prices in book.prices:
+            self.assertTrue(all(P_BOUNDS[k][0] <= v <= P_BOUNDS[k][1] for k, v in zip(PRODUCTS, prices)))
+
+        for _ in range(500):
+            node, product, amount = rng.choice(book.nodes), rng.choice(PRODUCTS), rng.randint(-10, 400)
+            if rng.random() < 0.5:
+                self.assertEqual(book[node].sell(product, amount), markets[node].sell(product, amount))
+            else:
+                self.assertEqual(book[node].buy(product, amount), markets[node].buy(product, amount))
+
+        for node in book.nodes:
+            self.assertEqual(book[node].get_prices(), markets[node].get_prices())
+            self.assertEqual(book[node].get_price_amount(), markets[node].get_price_amount())
+            self.assertEqual(book.get_price_amount(node), markets[node].get_price_amount())
+
+    # Buying and selling at many markets at once is the same as trading at each in turn
+    def test_batch(self):
+        rng = random.Random(3)
+        book = MarketBook(list("ABCD"), np.random.default_rng(3))
+        markets = book_markets(book)
+        pairs = [(i, k) for i in range(len(book.nodes)) for k in range(len(PRODUCTS))]
+        for _ in range(20):
+            nodes, products = zip(*rng.sample(pairs, 6))
+            amounts = [rng.randint(-10, 400) for _ in nodes]
+            sold, cost = book.sell(nodes, products, amounts)
+            expected = [markets[book.nodes[i]].sell(PRODUCTS[k], a) for i, k, a in zip(nodes, products, amounts)]
+            self.assertEqual(sold.tolist(), [a for _, a, _ in expected])
+            self.assertEqual(cost.tolist(), [c for _, _, c in expected])
+
+            nodes, products = zip(*[rng.choice(pairs) for _ in range(6)])
+            bought, cost = book.buy(nodes, products, amounts)
+            expected = [markets[book.nodes[i]].buy(PRODUCTS[k], a) for i, k, a in zip(nodes, products, amounts)]
+            self.assertEqual(bought.tolist(), [a for _, a, _ in expected])
+            self.assertEqual(cost.tolist(), [c for _, _, c in expected])
+
+        for node in book.nodes:
+            self.assertEqual(book.get_price_amount(node), markets[node].get_price_amount())
+
+
+class PlayerTableTestCase(unittest.TestCase):
+    # Scores from the table are the scores of the dict path for the same players
+    def test_scores(self):
+        game = Game.Game([Player.Player(), Player2.Player(), BasePlayer()], use_workers=False, vectorised=True, seed=3)
+        res = game.run_game(300)
+
+        dict_game = Game.Game([BasePlayer()], use_workers=False, seed=3)
+        dict_game.players = {p_id:{Game.INFO_INV:dict(p_info[Game.INFO_INV].items()), Game.INFO_GOAL:p_info[Game.INFO_GOAL]}
+                             for p_id, p_info in game.players.items()}
+        self.assertEqual(res, dict_game.game_result())
+
+    # Interest and penalties are charged as the dict path charges each player
+    def test_charge(self):
+        rng = random.Random(1)
+        nodes = list("ABCDEF")
+        table = PlayerTable(nodes, PRODUCTS, Game.INV_GOLD, capacity=2)
+        players = [(rng.choice(nodes), float(rng.randint(-5000, 5000))) for _ in range(20)]
+        for loc, gold in players:
+            table.add(loc, gold, {})
+        black = rng.sample(nodes, 2)
+
+        charged, outside = table.charge(0.1, black, Game.OUTSIDE_CIRCLE_PENALTY)
+        for row, (loc, gold) in enumerate(players):
+            interest = -0.1 * gold if gold < 0 else 0
+            gold -= interest
+            if loc in black:
+                gold -= Game.OUTSIDE_CIRCLE_PENALTY
+            self.assertEqual(charged[row], interest)
+            self.assertEqual(outside[row], loc in black)
+            self.assertEqual(table.gold[row], gold)
+
+
+# The state of game as Replay.state_at gives it, read from the engine
+def engine_state(game):
+    return {"turn":game.turn_num,
+            "players":{p_id:{"loc":p_info[Game.INFO_LOC], "gold":p_info[Game.INFO_INV][Game.INV_GOLD],
+                             "inventory":{k:p_info[Game.INFO_INV][k] for k in PRODUCTS}}
+                       for p_id, p_info in game.players.items()},
+            "markets":{node:{k:amount for k, (_, amount) in game.markets[node].get_price_amount().items()}
+                       for node in game.map.get_node_names()},
+            "status":dict(game.map.node_status)}
+
+
+class ReplayTestCase(unittest.TestCase):
+    # The replay gives the state of the engine on keyframes and on the turns between them
+    def test_state_at(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            replay_path = os.path.join(tmp, "game.replay")
+            game = Game.Game([Player.Player(), Player2.Player()], use_workers=False, seed=4,
+                             recorder=Replay.ReplayRecorder(replay_path, keyframe_every=10))
+            states = [engine_state(game)]
+            for turn in range(5, 65, 5):
+                game.run_game(60, pause_at=turn)
+                states.append(engine_state(game))
+
+            replay = Replay.Replay(replay_path)
+            self.assertEqual([k["turn"] for k in replay.keyframes], list(range(0, 70, 10)))
+            for state in states:
+                self.assertEqual(replay.state_at(state["turn"]), state)
+
+
+class TournamentTestCase(unittest.TestCase):
+    # A game that can't be sent to a worker is reported, the others are still played
+    def test_errors(self):
+        class Unpicklable(BasePlayer):
+            pass
+        results = list(Tournament.run_tournament([Unpicklable], 2, [1], processes=1, num_turns=5))
+        self.assertEqual(sorted(i for i, _, _ in results), [0, 1])
+        self.assertTrue(all(scores is None and error for _, scores, error in results))
+
+        results = list(Tournament.run_tournament([BasePlayer], 2, [1], processes=1, num_turns=5, seed=1))
+        self.assertTrue(all(scores is not None and error is None for _, scores, error in results))
+
+    # Stopping early does not wait for the remaining games
+    def test_close(self):
+        start = time.time()
+        games = Tournament.run_tournament([BasePlayer], 1000, [1], processes=1, num_turns=300, seed=1)
+        next(games)
+        games.close()
+        self.assertLess(time.time() - start, 10)
+
+
+if __name__ == "__main__":
+    runner = unittest.TextTestRunner()
+    runner.run(suite())